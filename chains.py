@@ -1,25 +1,81 @@
 import os
-import json
-from typing import List, Dict, Optional, Iterator
+import time
+import asyncio
+from io import StringIO
+from operator import itemgetter
+from typing import List, Dict, Optional, AsyncIterator, Tuple
+import httpx
+import orjson
+import numpy as np
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_community.chat_message_histories import ChatMessageHistory
-from embedding_processor import EmbeddingProcessor
-from openai import OpenAI
+from langchain_core.messages import SystemMessage
+from openai import AsyncOpenAI
+from rate_limiter import call_llm, estimate_tokens, stream_llm
+from ttl_cache import TTLCache
+from semantic_cache import SemanticCache, VectorIndex, make_prompt_hash
+from search_batcher import get_search_batcher
 
 load_dotenv()
 
 # ===== 설정 =====
-LLM = ChatOpenAI(model="gpt-4o-mini", temperature=0.3, api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI 호출 전체가 공유하는 커넥션 풀 (요청마다 TCP/TLS 연결을 새로 맺지 않도록)
+OPENAI_HTTP_CLIENT = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=httpx.Timeout(60.0, connect=10.0),
+)
+LLM = ChatOpenAI(
+    model="gpt-4o-mini",
+    temperature=0.3,
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_async_client=OPENAI_HTTP_CLIENT,
+    max_retries=0,  # 재시도는 rate_limiter.call_llm 이 담당 (SDK 재시도와 겹치지 않도록)
+)
+# 재작성 질문과 원 질문의 임베딩 유사도가 이 값 이상이면 원 질문 기준 선행 검색 결과를 그대로 사용
+SPECULATIVE_SIMILARITY = float(os.getenv("RAG_SPECULATIVE_SIMILARITY", "0.95"))
+# 세션 히스토리 보관 한도 (프로세스 메모리 보호)
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "10000"))
+HISTORY_TTL_SECONDS = int(os.getenv("HISTORY_TTL_SECONDS", "3600"))
+# 히스토리가 이 한도를 넘으면 오래된 턴을 요약 메시지 하나로 압축하고 최근 메시지만 원문 유지
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_CHARS = int(os.getenv("HISTORY_MAX_CHARS", "8000"))
+HISTORY_KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))
+# 질의 임베딩/검색 결과 캐시 (정규화된 질의 기준, 임베딩 코사인 거리가 이 값 미만이면 같은 질의로 간주)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+NEAR_DUPLICATE_DISTANCE = float(os.getenv("SEARCH_CACHE_NEAR_DUPLICATE_DISTANCE", "0.02"))
+SNIPPET_CACHE_SIZE = int(os.getenv("SNIPPET_CACHE_SIZE", "4096"))
+SNIPPET_CACHE_TTL_SECONDS = int(os.getenv("SNIPPET_CACHE_TTL_SECONDS", "3600"))
+# 스트리밍 토큰을 모아 보내는 기준 (바이트 수 또는 마지막 전송 후 경과 시간)
+STREAM_FLUSH_BYTES = 64
+STREAM_FLUSH_INTERVAL = 0.05
+
+_openai_client: Optional[AsyncOpenAI] = None
+
+def get_openai_client() -> AsyncOpenAI:
+    """스트리밍용 AsyncOpenAI 클라이언트 싱글톤 반환"""
+    global _openai_client
+    if _openai_client is None:
+        # 재시도는 rate_limiter.call_llm 이 담당
+        _openai_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"), http_client=OPENAI_HTTP_CLIENT, max_retries=0
+        )
+    return _openai_client
 
 # ===== 프롬프트 =====
+# 체인/스트리밍 경로가 바이트 단위로 같은 시스템 프롬프트를 쓰도록 한 곳에서 정의 (OpenAI 프롬프트 캐시 적중)
+SYSTEM_PROMPT = "너는 문맥과 대화 이력을 근거로 한국어로 답변한다. 문맥 내용은 [1], [2] 번호로 인용하라. 모르면 모른다고 말한다."
+SYSTEM_MESSAGE: Dict[str, str] = {"role": "system", "content": SYSTEM_PROMPT}  # 공유 객체이므로 수정 금지
+
 RAG_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", "너는 문맥과 대화 이력을 근거로 한국어로 답변한다. 문맥 내용은 [1], [2] 번호로 인용하라. 모르면 모른다고 말한다."),
+    ("system", SYSTEM_PROMPT),
     MessagesPlaceholder("history"),
-    ("human", "질문: {question}\n\nContext:\n{context}"),
+    ("system", "Context:\n{context}"),
+    ("human", "질문: {question}"),
 ])
 
 CONDENSE_PROMPT = ChatPromptTemplate.from_messages([
@@ -27,49 +83,169 @@ CONDENSE_PROMPT = ChatPromptTemplate.from_messages([
     ("human", "대화 이력:\n{history}\n\n최신 질문: {question}\n\n재작성:"),
 ])
 
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "다음 대화에서 이후 질문에 답하는 데 필요한 사실만 한국어로 간결하게 요약한다."),
+    ("human", "{history}"),
+])
+
 # ===== 유틸리티 =====
+# Milvus 엔티티 id -> 컨텍스트용 문단(제목/잘린 설명/링크), 같은 엔티티의 내용은 바뀌지 않으므로 재사용
+_snippet_cache = TTLCache(maxsize=SNIPPET_CACHE_SIZE, ttl=SNIPPET_CACHE_TTL_SECONDS)
+
+def format_snippet(item: Dict) -> str:
+    key = item.get("id")
+    snippet = _snippet_cache.get(key) if key is not None else None
+    if snippet is None:
+        snippet = (
+            f"{item.get('title') or ''}\n"
+            f"{(item.get('description') or item.get('content') or '')[:300]}\n"
+            f"{item.get('link') or ''}"
+        )
+        if key is not None:
+            _snippet_cache[key] = snippet
+    return snippet
+
 def build_context(items: List[Dict]) -> str:
-    lines = []
-    for i, item in enumerate(items, 1):
-        title = item.get("title", "")
-        snippet = (item.get("description") or item.get("content") or "")[:300]
-        link = item.get("link", "")
-        lines.append(f"[{i}] {title}\n{snippet}\n{link}")
-    return "\n\n".join(lines)
+    return "\n\n".join(f"[{i}] {format_snippet(item)}" for i, item in enumerate(items, 1))
+
+def sort_results(items: List[Dict]) -> List[Dict]:
+    """동일한 검색 결과 집합이 항상 같은 순서가 되도록 정렬 (유사도 내림차순, 동점은 링크/제목 기준)
+
+    COSINE 메트릭이라 distance 값은 클수록 가깝다.
+    """
+    return sorted(items, key=lambda item: (
+        -(item.get("distance") or 0.0),
+        item.get("link") or "",
+        item.get("title") or "",
+        str(item.get("id") or ""),
+    ))
+
+# 검색 결과 dict에는 항상 이 키들이 있음 (VectorStore.search_by_vectors)
+SOURCE_KEYS = ("title", "link", "author", "distance")
+_get_source_fields = itemgetter(*SOURCE_KEYS)
 
 def make_sources(items: List[Dict]) -> List[Dict]:
-    return [{
-        "index": i,
-        "title": item.get("title"),
-        "link": item.get("link"),
-        "author": item.get("author"),
-        "distance": item.get("distance"),
-    } for i, item in enumerate(items, 1)]
+    return [{"index": i, **dict(zip(SOURCE_KEYS, _get_source_fields(item)))} for i, item in enumerate(items, 1)]
+
+HISTORY_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+HISTORY_LABELS = {"human": "Human", "ai": "AI", "system": "Summary"}
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+def unit_vector(vector: List[float]) -> Optional[np.ndarray]:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    if not norm:
+        return None
+    return arr / norm
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    unit_a, unit_b = unit_vector(a), unit_vector(b)
+    if unit_a is None or unit_b is None:
+        return 0.0
+    return float(unit_a @ unit_b)
+
+# SSE 이벤트 고정 접두사
+META_EVENT_PREFIX = b'data: {"type":"meta",'
+DONE_EVENT_PREFIX = b'data: {"type":"done",'
+TOKEN_EVENT_PREFIX = b'data: {"type":"token","content":'
+
+def token_event(text: str) -> bytes:
+    return TOKEN_EVENT_PREFIX + orjson.dumps(text) + b"}\n\n"
 
 def history_to_text(messages) -> str:
     lines = []
     for m in messages:
-        role = "Human" if m.__class__.__name__ == "HumanMessage" else "AI"
-        lines.append(f"{role}: {m.content}")
+        lines.append(f"{HISTORY_LABELS.get(m.type, 'AI')}: {m.content}")
     return "\n".join(lines)
 
 # ===== 서비스 =====
 class RagService:
     def __init__(self):
-        self.processor = EmbeddingProcessor()
-        self.histories: Dict[str, ChatMessageHistory] = {}
+        self.histories = TTLCache(maxsize=HISTORY_MAX_SESSIONS, ttl=HISTORY_TTL_SECONDS)
+        # normalize_query(query) -> 임베딩 벡터
+        self.embedding_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL_SECONDS)
+        # (normalize_query(query), limit) -> 검색 결과 (단위 벡터 인덱스, limit별 그룹)
+        self.search_cache = VectorIndex(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL_SECONDS)
+        # 세션 없는 요청의 응답 캐시 (같거나 매우 유사한 질문은 검색/LLM 호출 생략)
+        self.response_cache = SemanticCache()
         self.answer_chain = RAG_PROMPT | LLM | StrOutputParser()
+        self.chain_with_history = RunnableWithMessageHistory(
+            self.answer_chain,
+            self.get_history,
+            input_messages_key="question",
+            history_messages_key="history"
+        )
         self.condense_chain = CONDENSE_PROMPT | LLM | StrOutputParser()
+        self.summary_chain = SUMMARY_PROMPT | LLM | StrOutputParser()
+        self._background_tasks = set()
+        # 요약(압축)이 진행 중인 세션 (같은 세션의 압축이 겹치지 않도록)
+        self._compacting = set()
     
     def get_history(self, session_id: str) -> ChatMessageHistory:
-        if session_id not in self.histories:
-            self.histories[session_id] = ChatMessageHistory()
-        return self.histories[session_id]
+        hist = self.histories.get(session_id)
+        if hist is None:
+            hist = ChatMessageHistory()
+        # 접근할 때마다 만료 시간 갱신
+        self.histories[session_id] = hist
+        return hist
+
+    async def compact_history(self, session_id: str):
+        """히스토리가 한도를 넘으면 오래된 턴을 요약 메시지 하나로 대체 (세션당 한 번에 하나만 실행)"""
+        if session_id in self._compacting:
+            return
+        self._compacting.add(session_id)
+        try:
+            await self._compact_history(session_id)
+        finally:
+            self._compacting.discard(session_id)
+
+    async def _compact_history(self, session_id: str):
+        hist = self.get_history(session_id)
+        messages = list(hist.messages)
+        total_chars = sum(len(m.content) for m in messages)
+        if len(messages) <= HISTORY_MAX_MESSAGES and total_chars <= HISTORY_MAX_CHARS:
+            return
+        older = messages[:-HISTORY_KEEP_MESSAGES]
+        if not older:
+            return
+        history_text = history_to_text(older)
+        try:
+            summary = await call_llm(
+                lambda: self.summary_chain.ainvoke({"history": history_text}),
+                estimate_tokens(history_text),
+            )
+        except Exception:
+            return
+        current = hist.messages
+        if len(current) < len(messages) or any(a is not b for a, b in zip(current, messages)):
+            # 요약 중 히스토리가 추가 이외의 방식으로 바뀌었으면 이번 압축은 포기
+            return
+        # 스냅샷의 최근 메시지 + 요약 중 뒤에 추가된 메시지는 그대로 유지
+        hist.messages = [SystemMessage(content=summary.strip())] + messages[len(older):] + current[len(messages):]
+
+    def schedule_compaction(self, session_id: str):
+        if session_id in self._compacting:
+            return
+        task = asyncio.create_task(self.compact_history(session_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
-    def seed_messages(self, session_id: str, messages: List[Dict]):
+    def seed_messages(self, session_id: str, messages: List[Dict], query: Optional[str] = None):
+        """서버 히스토리가 비어 있을 때(새 세션/만료/재시작)만 클라이언트가 보낸 이력으로 복원
+
+        클라이언트는 매 턴 전체 이력을 보내므로 이미 이력이 있으면 건너뛰고,
+        마지막에 포함된 이번 질문은 답변 저장 시 함께 기록되므로 제외한다.
+        """
         if not messages:
             return
         hist = self.get_history(session_id)
+        if hist.messages:
+            return
+        last = messages[-1]
+        if query is not None and last.get("role") == "user" and (last.get("content") or "").strip() == query.strip():
+            messages = messages[:-1]
         for msg in messages:
             role = msg.get("role")
             content = msg.get("content", "").strip()
@@ -80,117 +256,211 @@ class RagService:
             elif role == "assistant":
                 hist.add_ai_message(content)
     
-    def condense_query(self, session_id: str, query: str) -> str:
+    async def condense_query(self, session_id: str, query: str) -> str:
         hist = self.get_history(session_id)
         if not hist.messages:
             return query
         try:
             history_text = history_to_text(hist.messages)
-            return self.condense_chain.invoke({
-                "history": history_text,
-                "question": query
-            }).strip() or query
+            rephrased = await call_llm(
+                lambda: self.condense_chain.ainvoke({
+                    "history": history_text,
+                    "question": query
+                }),
+                estimate_tokens(history_text, query),
+            )
+            return rephrased.strip() or query
         except:
             return query
     
-    def rag_query(self, query: str, session_id: str = None, messages: List[Dict] = None, limit: int = 5) -> Dict:
+    async def embed(self, query: str) -> List[float]:
+        """질의 임베딩 (캐시 우선, 미스는 동시 요청과 묶어 한 번의 API 호출로 처리)"""
+        key = normalize_query(query)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            vector = await get_search_batcher().embed(query)
+            if any(vector):
+                self.embedding_cache[key] = vector
+        return vector
+
+    async def _cached_results(self, key: Tuple[str, int], unit: Optional[np.ndarray], limit: int) -> Optional[List[Dict]]:
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+        if unit is None:
+            return None
+        match = await self.search_cache.anearest(unit, limit)
+        if match is not None and 1.0 - match[0] < NEAR_DUPLICATE_DISTANCE:
+            return match[1]
+        return None
+
+    async def search(self, query: str, vector: List[float], limit: int) -> List[Dict]:
+        """벡터 검색 (같은 질의 또는 임베딩이 거의 같은 질의의 결과는 캐시에서 반환, 미스는 동시 요청과 묶어 검색)"""
+        key = (normalize_query(query), limit)
+        unit = unit_vector(vector)
+        results = await self._cached_results(key, unit, limit)
+        if results is not None:
+            return results
+        results = await get_search_batcher().search_vector(vector, limit)
+        if results and unit is not None:
+            self.search_cache.put(key, unit, limit, results)
+        return results
+
+    async def _embed_and_search(self, query: str, limit: int) -> Tuple[List[float], List[Dict]]:
+        vector = await self.embed(query)
+        return vector, await self.search(query, vector, limit)
+
+    async def retrieve(self, session_id: Optional[str], query: str, limit: int) -> Tuple[str, List[Dict]]:
+        """질문 재작성과 원 질문 기준 검색을 동시에 수행하고, 재작성 결과가 크게 다를 때만 재검색"""
+        if not session_id:
+            _, results = await self._embed_and_search(query, limit)
+            return query, sort_results(results)
+
+        effective_query, (query_vector, results) = await asyncio.gather(
+            self.condense_query(session_id, query),
+            self._embed_and_search(query, limit),
+        )
+        if effective_query != query:
+            rephrased_vector = await self.embed(effective_query)
+            if cosine_similarity(query_vector, rephrased_vector) < SPECULATIVE_SIMILARITY:
+                results = await self.search(effective_query, rephrased_vector, limit)
+        return effective_query, sort_results(results)
+
+    async def rag_query(self, query: str, session_id: str = None, messages: List[Dict] = None, limit: int = 5) -> Dict:
         # 1. 메시지 시드
         if session_id and messages:
-            self.seed_messages(session_id, messages)
-        
-        # 2. 질문 재작성
-        effective_query = query
-        if session_id:
-            effective_query = self.condense_query(session_id, query)
+            self.seed_messages(session_id, messages, query)
+
+        # 세션 없는 요청은 응답 캐시 우선 (여기서 만든 임베딩은 embedding_cache를 통해 검색에 재사용됨)
+        cache_key: Optional[Tuple[str, Optional[np.ndarray], str]] = None
+        if not session_id:
+            unit = unit_vector(await self.embed(query))
+            cache_key = (normalize_query(query), unit, make_prompt_hash(LLM.model_name, LLM.temperature, SYSTEM_PROMPT, limit))
+            cached = await self.response_cache.lookup(*cache_key)
+            if cached is not None:
+                return {**cached, "query": query, "rephrased_query": query}
         
-        # 3. 검색
-        results = self.processor.search_similar_content(effective_query, limit)
+        # 2~3. 질문 재작성 + 검색 (원 질문 기준 선행 검색과 병렬)
+        effective_query, results = await self.retrieve(session_id, query, limit)
         context = build_context(results)
         
         # 4. 답변 생성 (히스토리 포함)
         if session_id:
-            chain_with_history = RunnableWithMessageHistory(
-                self.answer_chain,
-                self.get_history,
-                input_messages_key="question",
-                history_messages_key="history"
-            )
-            answer = chain_with_history.invoke(
-                {"question": query, "context": context},
-                config={"configurable": {"session_id": session_id}}
+            answer = await call_llm(
+                lambda: self.chain_with_history.ainvoke(
+                    {"question": query, "context": context},
+                    config={"configurable": {"session_id": session_id}}
+                ),
+                estimate_tokens(history_to_text(self.get_history(session_id).messages), query, context),
             )
-            # 히스토리에 이번 턴 저장
-            hist = self.get_history(session_id)
-            hist.add_user_message(query)
-            hist.add_ai_message(answer)
+            # 이번 턴(질문/답변)은 RunnableWithMessageHistory가 이미 히스토리에 저장함
+            self.schedule_compaction(session_id)
         else:
-            answer = self.answer_chain.invoke({"question": query, "context": context, "history": []})
+            answer = await call_llm(
+                lambda: self.answer_chain.ainvoke({"question": query, "context": context, "history": []}),
+                estimate_tokens(query, context),
+            )
         
-        return {
+        response = {
             "query": query,
             "rephrased_query": effective_query,
             "answer": answer,
             "sources": make_sources(results),
             "items": results,
         }
+        if cache_key is not None and results and answer:
+            self.response_cache.store(*cache_key, response)
+        return response
 
-    def stream_answer(self, query: str, session_id: Optional[str] = None, messages: Optional[List[Dict]] = None, limit: int = 5) -> Iterator[str]:
+    async def stream_answer(self, query: str, session_id: Optional[str] = None, messages: Optional[List[Dict]] = None, limit: int = 5) -> AsyncIterator[bytes]:
         # 1) 히스토리 시드
         if session_id and messages:
-            self.seed_messages(session_id, messages)
-
-        # 2) 질문 재작성은 검색에만 사용
-        effective_query = query
-        if session_id:
-            effective_query = self.condense_query(session_id, query)
+            self.seed_messages(session_id, messages, query)
 
-        # 3) 검색 및 컨텍스트 구성
-        results = self.processor.search_similar_content(effective_query, limit)
+        # 2~3) 질문 재작성(검색에만 사용) + 검색 및 컨텍스트 구성
+        effective_query, results = await self.retrieve(session_id, query, limit)
         context = build_context(results)
 
-        # 4) 메시지 구성 (시스템 + 대화이력 + 사용자 메시지[컨텍스트 포함])
-        system_content = "너는 문맥과 대화 이력을 근거로 한국어로 답변한다. 문맥 내용은 [1], [2] 번호로 인용하라. 모르면 모른다고 말한다."
-        chat_messages: List[Dict[str, str]] = [{"role": "system", "content": system_content}]
+        # 4) 메시지 구성 (캐시 가능한 고정 prefix: 시스템 + 대화이력 → 매 턴 바뀌는 컨텍스트 → 질문)
+        chat_messages: List[Dict[str, str]] = [SYSTEM_MESSAGE]
 
         hist: Optional[ChatMessageHistory] = None
         if session_id:
             hist = self.get_history(session_id)
             for m in hist.messages:
-                role = "user" if m.__class__.__name__ == "HumanMessage" else "assistant"
-                chat_messages.append({"role": role, "content": m.content})
-
-        user_prompt = f"질문: {query}\n\nContext:\n{context}"
-        chat_messages.append({"role": "user", "content": user_prompt})
-
-        # 5) OpenAI 스트리밍
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        stream = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.3,
-            messages=chat_messages,
-            stream=True,
-        )
+                chat_messages.append({"role": HISTORY_ROLES.get(m.type, "assistant"), "content": m.content})
 
-        # 먼저 메타 정보 전송 (원하는 경우 프론트에서 선표시 가능)
-        meta_payload = {
-            "type": "meta",
-            "rephrased_query": effective_query,
-            "sources": make_sources(results),
-        }
-        yield f"data: {json.dumps(meta_payload, ensure_ascii=False)}\n\n"
+        chat_messages.append({"role": "system", "content": f"Context:\n{context}"})
+        chat_messages.append({"role": "user", "content": f"질문: {query}"})
+
+        # 5) OpenAI 스트리밍 (스트림을 다 읽을 때까지 동시성 슬롯 유지)
+        client = get_openai_client()
+        async with stream_llm(
+            lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                temperature=0.3,
+                messages=chat_messages,
+                stream=True,
+                # 세션 단위로 OpenAI prompt cache 라우팅
+                extra_body={"prompt_cache_key": session_id} if session_id else None,
+            ),
+            estimate_tokens(*(m["content"] for m in chat_messages)),
+        ) as stream:
+            # meta/done 이벤트가 공유하는 필드는 한 번만 직렬화 ('{'를 뗀 나머지를 각 이벤트에 이어 붙임)
+            shared_fields = orjson.dumps({
+                "rephrased_query": effective_query,
+                "sources": make_sources(results),
+            })[1:]
 
-        collected_tokens: List[str] = []
-        for chunk in stream:
+            # 먼저 메타 정보 전송 (원하는 경우 프론트에서 선표시 가능)
+            yield META_EVENT_PREFIX + shared_fields + b"\n\n"
+
+            # 짧은 토큰들을 STREAM_FLUSH_BYTES 또는 STREAM_FLUSH_INTERVAL 단위로 묶어 한 프레임으로 전송
+            answer_buf = StringIO()
+            frame = StringIO()
+            frame_bytes = 0
+            last_flush = time.monotonic()
+            chunks = aiter(stream)
+            next_chunk: Optional[asyncio.Future] = None
             try:
-                delta = chunk.choices[0].delta
-                token = getattr(delta, "content", None) if hasattr(delta, "content") else delta.get("content")  # type: ignore
-            except Exception:
-                token = None
-            if token:
-                collected_tokens.append(token)
-                yield f"data: {json.dumps({'type': 'token', 'content': token}, ensure_ascii=False)}\n\n"
+                while True:
+                    if next_chunk is None:
+                        next_chunk = asyncio.ensure_future(anext(chunks))
+                    timeout = max(0.0, last_flush + STREAM_FLUSH_INTERVAL - time.monotonic()) if frame_bytes else None
+                    done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+                    if not done:
+                        yield token_event(frame.getvalue())
+                        frame = StringIO()
+                        frame_bytes = 0
+                        last_flush = time.monotonic()
+                        continue
+                    try:
+                        chunk = next_chunk.result()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_chunk = None
+                    try:
+                        delta = chunk.choices[0].delta
+                        token = getattr(delta, "content", None) if hasattr(delta, "content") else delta.get("content")  # type: ignore
+                    except Exception:
+                        token = None
+                    if token:
+                        answer_buf.write(token)
+                        frame.write(token)
+                        frame_bytes += len(token.encode("utf-8"))
+                        if frame_bytes >= STREAM_FLUSH_BYTES or time.monotonic() - last_flush >= STREAM_FLUSH_INTERVAL:
+                            yield token_event(frame.getvalue())
+                            frame = StringIO()
+                            frame_bytes = 0
+                            last_flush = time.monotonic()
+                if frame_bytes:
+                    yield token_event(frame.getvalue())
+            finally:
+                if next_chunk is not None:
+                    next_chunk.cancel()
 
-        answer_text = ("".join(collected_tokens)).strip()
+        answer_text = answer_buf.getvalue().strip()
 
         # 히스토리에 저장
         if session_id:
@@ -198,15 +468,10 @@ class RagService:
                 hist = self.get_history(session_id)
             hist.add_user_message(query)
             hist.add_ai_message(answer_text)
+            self.schedule_compaction(session_id)
 
-        final_payload = {
-            "type": "final",
-            "answer": answer_text,
-            "rephrased_query": effective_query,
-            "sources": make_sources(results),
-            "items": results,
-        }
-        yield f"data: {json.dumps(final_payload, ensure_ascii=False)}\n\n"
+        # 답변 본문은 토큰 이벤트로 이미 전송했으므로 종료 이벤트에는 다시 싣지 않음
+        yield DONE_EVENT_PREFIX + shared_fields + b"\n\n"
 
 # ===== 전역 인스턴스 =====
 _service = None
@@ -217,8 +482,8 @@ def get_service() -> RagService:
         _service = RagService()
     return _service
 
-def run_rag_qa(query: str, limit: int = 5, messages: Optional[List[Dict]] = None, session_id: Optional[str] = None) -> Dict:
-    return get_service().rag_query(query, session_id, messages, limit)
+async def run_rag_qa(query: str, limit: int = 5, messages: Optional[List[Dict]] = None, session_id: Optional[str] = None) -> Dict:
+    return await get_service().rag_query(query, session_id, messages, limit)
 
-def stream_rag_qa(query: str, limit: int = 5, messages: Optional[List[Dict]] = None, session_id: Optional[str] = None) -> Iterator[str]:
+def stream_rag_qa(query: str, limit: int = 5, messages: Optional[List[Dict]] = None, session_id: Optional[str] = None) -> AsyncIterator[bytes]:
     return get_service().stream_answer(query, session_id, messages, limit)
\ No newline at end of file
@@ -3,17 +3,27 @@ RSS 데이터 임베딩 처리 메인 모듈
 JSON 파일에서 RSS 아이템을 읽어 새로운 항목만 임베딩하여 벡터 DB에 저장합니다.
 """
 
+import asyncio
 import json
 import os
-from typing import Dict, List
+import threading
+import time
+from typing import Dict, List, Optional
 from datetime import datetime
 import logging
-from vector_store import VectorStore
+import orjson
+from vector_store import EMBEDDING_BATCH_SIZE, VectorStore
+from rss.storage import read_log
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# process_all_items_async 파이프라인 설정 (로그의 처리량을 보고 워크로드에 맞게 조정)
+EMBED_CONCURRENCY = 8  # 동시 임베딩 API 호출 수 (호출당 EMBEDDING_BATCH_SIZE개)
+MILVUS_BATCH_SIZE = int(os.getenv("MILVUS_BATCH_SIZE", "500"))  # insert 1회당 엔티티 수
+MILVUS_CONCURRENT_UPSERTS = int(os.getenv("MILVUS_CONCURRENT_UPSERTS", "4"))  # 동시 Milvus insert 호출 수
+
 class EmbeddingProcessor:
     def __init__(self, 
                  json_file_path: str = "data",
@@ -44,32 +54,37 @@ class EmbeddingProcessor:
         
         logger.info("임베딩 처리기가 초기화되었습니다.")
     
-    def load_rss_items(self) -> Dict[str, Dict]:
-        """JSON 파일 또는 디렉토리(재귀)에서 모든 RSS 아이템들을 로드"""
+    def load_rss_items(self, json_file_path: Optional[str] = None) -> Dict[str, Dict]:
+        """JSON 파일 또는 디렉토리(재귀)에서 모든 RSS 아이템들을 로드 (경로를 주지 않으면 self.json_file_path)"""
         try:
-            path = self.json_file_path
-            if not os.path.exists(path):
+            path = json_file_path or self.json_file_path
+            if not os.path.exists(path) and not os.path.exists(path + ".log"):
                 logger.error(f"경로를 찾을 수 없습니다: {path}")
                 return {}
 
             aggregated: Dict[str, Dict] = {}
 
             def _load_file(fp: str) -> Dict[str, Dict]:
+                # 스냅샷(.json) + 아직 합쳐지지 않은 추가 로그(.json.log)
+                data: Dict[str, Dict] = {}
                 try:
-                    with open(fp, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if isinstance(data, dict):
-                            return data
-                        return {}
+                    if os.path.exists(fp):
+                        with open(fp, 'rb') as f:
+                            loaded = orjson.loads(f.read())
+                            if isinstance(loaded, dict):
+                                data = loaded
+                    data.update(read_log(fp + ".log"))
+                    return data
                 except Exception as e:
                     logger.warning(f"JSON 로드 실패({fp}): {e}")
-                    return {}
+                    return data
 
             if os.path.isdir(path):
                 for root, _, files in os.walk(path):
-                    for name in files:
-                        if not name.endswith('.json'):
-                            continue
+                    # 스냅샷 없이 로그만 있는 파일도 포함
+                    snapshots = {name[:-len('.log')] if name.endswith('.json.log') else name
+                                 for name in files if name.endswith(('.json', '.json.log'))}
+                    for name in sorted(snapshots):
                         fp = os.path.join(root, name)
                         items = _load_file(fp)
                         for content_hash, item in items.items():
@@ -106,44 +121,102 @@ class EmbeddingProcessor:
         logger.info(f"새로운 아이템 {len(new_items)}개를 발견했습니다.")
         return new_items
     
-    def process_all_items(self) -> Dict[str, int]:
-        """모든 RSS 아이템을 처리하여 새로운 것들만 임베딩"""
+    def process_all_items(self, json_file_path: Optional[str] = None) -> Dict[str, int]:
+        """모든 RSS 아이템을 처리하여 새로운 것들만 임베딩 (이벤트 루프가 없는 스레드/CLI용)"""
+        return asyncio.run(self.process_all_items_async(json_file_path))
+
+    async def process_all_items_async(self, json_file_path: Optional[str] = None) -> Dict[str, int]:
+        """
+        process_all_items의 파이프라인 버전
+        로드 → 임베딩 → 삽입 단계를 크기 제한 큐로 연결하고 단계별 작업자를 두어
+        OpenAI 임베딩 대기와 Milvus 삽입이 겹치도록 처리합니다.
+        json_file_path를 주면 해당 파일만 처리합니다 (같은 처리기로 피드별 파일 처리).
+        """
         try:
-            # RSS 아이템 로드
-            all_items = self.load_rss_items()
+            all_items = await asyncio.to_thread(self.load_rss_items, json_file_path)
             if not all_items:
                 logger.warning("처리할 RSS 아이템이 없습니다.")
                 return {"total": 0, "new": 0, "processed": 0}
-            
-            # 새로운 아이템 필터링
+
             new_items = self.filter_new_items(all_items)
-            
             if not new_items:
                 logger.info("모든 아이템이 이미 처리되었습니다.")
-                return {
-                    "total": len(all_items),
-                    "new": 0,
-                    "processed": len(all_items) - len(new_items)
-                }
-            
-            # 새로운 아이템들을 벡터 DB에 추가
+                return {"total": len(all_items), "new": 0, "processed": len(all_items)}
+
             logger.info(f"{len(new_items)}개의 새로운 아이템을 처리합니다...")
-            added_count = self.vector_store.add_items_batch(new_items)
-            
+            added_count = await self._run_ingest_pipeline(new_items)
+            if added_count:
+                await asyncio.to_thread(self.vector_store.collection.flush)
+
             result = {
                 "total": len(all_items),
                 "new": len(new_items),
                 "processed": added_count,
                 "skipped": len(new_items) - added_count
             }
-            
             logger.info(f"처리 완료: {result}")
             return result
-            
+
         except Exception as e:
             logger.error(f"아이템 처리 중 오류 발생: {e}")
             return {"total": 0, "new": 0, "processed": 0, "error": str(e)}
-    
+
+    async def _run_ingest_pipeline(self, items: List[Dict]) -> int:
+        """임베딩 배치 큐 → 임베딩 작업자 → 엔티티 큐 → 삽입 배치 묶기 → 삽입 작업자"""
+        embed_q: asyncio.Queue = asyncio.Queue(maxsize=2 * EMBED_CONCURRENCY)
+        entity_q: asyncio.Queue = asyncio.Queue(maxsize=2 * EMBED_CONCURRENCY)
+        upsert_q: asyncio.Queue = asyncio.Queue(maxsize=2 * MILVUS_CONCURRENT_UPSERTS)
+        added = 0
+        started = time.perf_counter()
+
+        async def load():
+            for start in range(0, len(items), EMBEDDING_BATCH_SIZE):
+                await embed_q.put(items[start:start + EMBEDDING_BATCH_SIZE])
+            for _ in range(EMBED_CONCURRENCY):
+                await embed_q.put(None)
+
+        async def embed_worker():
+            while (batch := await embed_q.get()) is not None:
+                try:
+                    await entity_q.put(await asyncio.to_thread(self.vector_store.build_entities, batch))
+                except Exception as e:
+                    # 실패한 배치는 처리 완료로 표시하지 않아 다음 실행 때 재시도
+                    logger.error(f"배치 임베딩 실패: {e}")
+
+        async def embed():
+            await asyncio.gather(*(embed_worker() for _ in range(EMBED_CONCURRENCY)))
+            await entity_q.put(None)
+
+        async def regroup():
+            buffer: List[Dict] = []
+            while (entities := await entity_q.get()) is not None:
+                buffer.extend(entities)
+                while len(buffer) >= MILVUS_BATCH_SIZE:
+                    await upsert_q.put(buffer[:MILVUS_BATCH_SIZE])
+                    buffer = buffer[MILVUS_BATCH_SIZE:]
+            if buffer:
+                await upsert_q.put(buffer)
+            for _ in range(MILVUS_CONCURRENT_UPSERTS):
+                await upsert_q.put(None)
+
+        async def upsert_worker():
+            nonlocal added
+            while (entities := await upsert_q.get()) is not None:
+                try:
+                    inserted = await asyncio.to_thread(self.vector_store.insert_entities, entities)
+                    added += inserted
+                    logger.info(f"배치 삽입 완료: {added}/{len(items)}")
+                except Exception as e:
+                    logger.error(f"배치 삽입 실패: {e}")
+
+        await asyncio.gather(load(), embed(), regroup(), *(upsert_worker() for _ in range(MILVUS_CONCURRENT_UPSERTS)))
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"삽입 처리량: {added / elapsed if elapsed else 0:.1f}건/초 "
+            f"({added}건, {elapsed:.2f}초, batch={MILVUS_BATCH_SIZE}, concurrency={MILVUS_CONCURRENT_UPSERTS})"
+        )
+        return added
+
     def process_single_item(self, content_hash: str) -> bool:
         """특정 아이템 하나만 처리"""
         try:
@@ -182,6 +255,14 @@ class EmbeddingProcessor:
     def search_similar_title(self, query: str, limit: int = 5) -> List[Dict]:
         """쿼리와 유사한 제목 검색 (옵션 A: full_vector 기준)"""
         return self.vector_store.search_similar(query, "full_vector", limit)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """여러 검색 쿼리를 한 번의 API 호출로 임베딩"""
+        return self.vector_store.embed_queries(queries)
+
+    def search_by_vectors(self, query_vectors: List[List[float]], limit: int = 5) -> List[List[Dict]]:
+        """여러 쿼리 벡터를 한 번의 검색 호출로 처리"""
+        return self.vector_store.search_by_vectors(query_vectors, limit)
     
     def get_statistics(self) -> Dict:
         """처리 통계 정보 반환"""
@@ -217,6 +298,20 @@ class EmbeddingProcessor:
         }
 
 
+# 프로세스 전체가 공유하는 기본 임베딩 처리기 (Milvus 연결/OpenAI 클라이언트를 한 번만 생성)
+_default_processor: Optional[EmbeddingProcessor] = None
+_default_processor_lock = threading.Lock()
+
+def get_default_processor() -> EmbeddingProcessor:
+    """data 디렉토리 기준 임베딩 처리기 싱글톤 반환 (동시 첫 호출에도 인스턴스는 하나만 생성)"""
+    global _default_processor
+    if _default_processor is None:
+        with _default_processor_lock:
+            if _default_processor is None:
+                _default_processor = EmbeddingProcessor()
+    return _default_processor
+
+
 def main():
     """메인 실행 함수"""
     import argparse
@@ -96,11 +96,9 @@ function ChatInterface() {
                 applyToken(evt.content);
               } else if (evt.type === 'meta') {
                 applyMeta(evt);
-              } else if (evt.type === 'final' && evt.answer) {
-                // 최종 보정 (혹시 누락된 토큰 보완)
-                setMessages(prev => prev.map(m => (
-                  m.id === aiId ? { ...m, text: evt.answer, sources: evt.sources || m.sources } : m
-                )));
+              } else if (evt.type === 'done') {
+                // 종료 이벤트: 답변 본문은 토큰으로 이미 수신, 출처만 보정
+                applyMeta(evt);
               }
             } catch (e) {
               // 무시
@@ -1,8 +1,13 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
+from fastapi.middleware.gzip import GZipMiddleware
+from typing import Callable, Dict, List, Optional, Tuple, Hashable
 from contextlib import asynccontextmanager
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+import asyncio
+import anyio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import os
 
 # RSS 리더 관련 임포트
@@ -11,21 +16,99 @@ from rss.reader import create_rss_reader_for
 from scheduler import get_scheduler, start_scheduler, stop_scheduler
 
 # 임베딩 처리 관련 임포트
-from embedding_processor import EmbeddingProcessor
+from embedding_processor import EmbeddingProcessor, get_default_processor
 from chains import run_rag_qa, stream_rag_qa
+from search_batcher import MicroBatcher, get_search_batcher
 from vector_store import VectorStore
 
 # 환경 변수 로드는 chains.py에서 처리
 
+
+class QaBatcher(MicroBatcher):
+    """
+    무상태 /qa 요청(session_id/messages 없음)을 짧은 시간 창(max_wait_ms, 최대 max_batch건) 단위로 모아 처리하는 배처.
+    chat.completions는 한 요청에 여러 프롬프트를 받지 않으므로 서로 다른 질의는 동시에 실행하고,
+    같은 창 안에 들어온 동일한 질의는 한 번만 실행해 결과를 공유한다. 세션 요청은 배처를 거치지 않는다.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait_ms: int = 30, max_queue: int = 1024):
+        super().__init__(None, max_batch, max_wait_ms, max_queue)
+
+    async def submit(self, query: str, limit: int = 5, messages=None, session_id=None) -> Dict:
+        kwargs = {"query": query, "limit": limit, "messages": messages, "session_id": session_id}
+        # 세션/메시지가 있는 요청은 합칠 수 없으므로 수집 창을 기다리지 않고 바로 실행
+        if self._worker is None or session_id or messages:
+            return await run_rag_qa(**kwargs)
+        return await super().submit(kwargs)
+
+    async def _dispatch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        groups: Dict[Hashable, Tuple[Dict, List[asyncio.Future]]] = {}
+        for kwargs, future in batch:
+            groups.setdefault((kwargs["query"], kwargs["limit"]), (kwargs, []))[1].append(future)
+        # 그룹마다 끝나는 즉시 해당 요청에 결과 전달 (느린 질의가 같은 배치의 다른 응답을 붙잡지 않도록)
+        await asyncio.gather(*(self._run_group(kwargs, futures) for kwargs, futures in groups.values()))
+
+    @staticmethod
+    async def _run_group(kwargs: Dict, futures: List[asyncio.Future]):
+        try:
+            result = await run_rag_qa(**kwargs)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in futures:
+            if not future.done():
+                future.set_result(result)
+
+
+qa_batcher = QaBatcher(
+    max_batch=int(os.getenv("QA_BATCH_MAX", "8")),
+    max_wait_ms=int(os.getenv("QA_BATCH_WAIT_MS", "30")),
+    max_queue=int(os.getenv("QA_BATCH_QUEUE", "1024")),
+)
+
+# 블로킹 호출(Milvus 검색, 임베딩)을 오프로드하는 기본 스레드 풀 크기
+DEFAULT_EXECUTOR_WORKERS = int(os.getenv("DEFAULT_EXECUTOR_WORKERS", "32"))
+# 동기(def) 엔드포인트를 실행하는 Starlette 스레드풀 크기
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "200"))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 시작 시
+    # asyncio.to_thread로 넘기는 Milvus 검색/임베딩 호출이 기본 실행기(최대 cpu+4 스레드)에서 줄 서지 않도록 확장
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=DEFAULT_EXECUTOR_WORKERS, thread_name_prefix="rag")
+    )
+    # 블로킹 엔드포인트(def)가 실행되는 스레드풀 한도 (기본 40)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # 임베딩 처리기(Milvus 연결, OpenAI 클라이언트)를 시작 시 한 번만 생성
+    # Milvus 준비를 기다리는 재시도가 길 수 있어 시작을 막지 않고 백그라운드 스레드에서 진행
+    app.state.embedding_processor = None
+    app.state.embedding_processor_init = asyncio.create_task(load_embedding_processor(app))
+    # RSS 피드 수집용 공유 HTTP 커넥션 풀 (피드마다 TCP/TLS 연결을 새로 맺지 않도록)
+    app.state.http = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        timeout=httpx.Timeout(10.0),
+    )
     start_scheduler()
+    qa_batcher.start()
+    get_search_batcher().start()
     yield
     # 종료 시
-    stop_scheduler()
-
-app = FastAPI(title="SSU RAG Chatbot", version="1.0.0", lifespan=lifespan)
+    await qa_batcher.stop()
+    await get_search_batcher().stop()
+    await asyncio.to_thread(stop_scheduler)
+    await app.state.http.aclose()
+    # chains.OPENAI_HTTP_CLIENT는 import 시점에 만든 LLM/AsyncOpenAI가 잡고 있는 프로세스 수명 객체이므로 닫지 않음
+    # (같은 프로세스에서 lifespan이 다시 실행되면 닫힌 클라이언트로 모든 OpenAI 호출이 실패)
+
+app = FastAPI(
+    title="SSU RAG Chatbot",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # CORS 설정
 app.add_middleware(
@@ -35,25 +118,32 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 큰 JSON 응답(/rss/items 등) 압축 (text/event-stream 스트리밍 응답은 GZipMiddleware가 제외함)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
-# ChatInput 클래스 제거 - 더 이상 필요 없음
-
-# 임베딩 처리기 초기화 (전역 변수)
-embedding_processor = None
-
-def get_embedding_processor():
-    """임베딩 처리기 싱글톤 인스턴스 반환"""
-    global embedding_processor
-    if embedding_processor is None:
-        try:
-            embedding_processor = EmbeddingProcessor()
-        except Exception as e:
-            print(f"임베딩 처리기 초기화 실패: {e}")
-            embedding_processor = None
-    return embedding_processor
-
-# LangServe 관련 코드 모두 제거
-# 순수 FastAPI 엔드포인트만 사용
+def init_embedding_processor() -> Optional[EmbeddingProcessor]:
+    """임베딩 처리기 초기화 (실패 시 None)"""
+    try:
+        return get_default_processor()
+    except Exception as e:
+        print(f"임베딩 처리기 초기화 실패: {e}")
+        return None
+
+async def load_embedding_processor(app: FastAPI):
+    app.state.embedding_processor = await asyncio.to_thread(init_embedding_processor)
+
+async def get_embedding_processor(request: Request) -> EmbeddingProcessor:
+    """lifespan에서 만든 임베딩 처리기 반환 (초기화 중이거나 실패했으면 503, 실패한 경우 백그라운드에서 다시 초기화)"""
+    state = request.app.state
+    processor = getattr(state, "embedding_processor", None)
+    if processor is not None:
+        return processor
+    init = getattr(state, "embedding_processor_init", None)
+    if init is not None and not init.done():
+        raise HTTPException(status_code=503, detail="임베딩 처리기를 초기화하는 중입니다. 잠시 후 다시 시도해주세요.")
+    # 요청 스레드를 막지 않도록 재시도도 백그라운드에서 진행
+    state.embedding_processor_init = asyncio.create_task(load_embedding_processor(request.app))
+    raise HTTPException(status_code=503, detail="임베딩 처리기를 초기화할 수 없습니다. Milvus 서버와 OpenAI API 키를 확인해주세요.")
 
 @app.get("/")
 async def root():
@@ -85,50 +175,63 @@ async def get_rss_status():
     scheduler = get_scheduler()
     return scheduler.get_status()
 
+def conditional_response(request: Request, etag: str, build: Callable[[], Dict]) -> Response:
+    """If-None-Match가 etag와 같으면 본문 없이 304, 아니면 build() 결과를 ETag 헤더와 함께 반환"""
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    return ORJSONResponse(build(), headers={"ETag": etag})
+
 @app.get("/rss/items")
-async def get_all_rss_items():
+def get_all_rss_items(request: Request):
     """모든 RSS 아이템 가져오기"""
     reader = get_rss_reader()
-    items = reader.get_all_items()
-    return {
-        "total_items": len(items),
-        "items": items
-    }
+    total, latest_epoch = reader.get_version()
+
+    def build():
+        items = reader.get_all_items()
+        return {
+            "total_items": len(items),
+            "items": items
+        }
+
+    return conditional_response(request, f'W/"{total}-{latest_epoch}"', build)
 
 @app.get("/rss/recent")
-async def get_recent_rss_items(count: int = 10):
+def get_recent_rss_items(request: Request, count: int = 10):
     """최근 RSS 아이템 가져오기"""
     reader = get_rss_reader()
-    items = reader.get_recent_items(count)
-    return {
-        "requested_count": count,
-        "returned_count": len(items),
-        "items": items
-    }
+    total, latest_epoch = reader.get_version()
+
+    def build():
+        items = reader.get_recent_items(count)
+        return {
+            "requested_count": count,
+            "returned_count": len(items),
+            "items": items
+        }
+
+    return conditional_response(request, f'W/"{total}-{latest_epoch}-{count}"', build)
 
 @app.post("/rss/fetch")
-async def fetch_rss_now():
+async def fetch_rss_now(request: Request):
     """즉시 모든 RSS 피드 가져오기 (KNOWN_SOURCES 순회)"""
     scheduler = get_scheduler()
-    return scheduler.fetch_now()
+    return await scheduler.fetch_now_async(request.app.state.http)
 
 
 @app.post("/rss/fetch/{identifier}")
-async def fetch_rss_for(identifier: str):
+async def fetch_rss_for(identifier: str, request: Request):
     """특정 identifier 피드를 즉시 수집"""
     reader = create_rss_reader_for(identifier)
-    return reader.fetch_feed()
+    return await reader.fetch_feed_async(request.app.state.http)
 
 # 벡터 임베딩 관련 엔드포인트들
 @app.post("/vector/process")
-async def process_embeddings():
+async def process_embeddings(processor: EmbeddingProcessor = Depends(get_embedding_processor)):
     """RSS 아이템들을 임베딩하여 벡터 DB에 저장"""
-    processor = get_embedding_processor()
-    if not processor:
-        return {"error": "임베딩 처리기를 초기화할 수 없습니다. Milvus 서버와 OpenAI API 키를 확인해주세요."}
-    
     try:
-        result = processor.process_all_items()
+        result = await processor.process_all_items_async()
         return {
             "message": "임베딩 처리 완료",
             "result": result
@@ -137,12 +240,8 @@ async def process_embeddings():
         return {"error": f"임베딩 처리 중 오류: {str(e)}"}
 
 @app.get("/vector/stats")
-async def get_vector_stats():
+def get_vector_stats(processor: EmbeddingProcessor = Depends(get_embedding_processor)):
     """벡터 DB 통계 정보"""
-    processor = get_embedding_processor()
-    if not processor:
-        return {"error": "임베딩 처리기를 초기화할 수 없습니다."}
-    
     try:
         stats = processor.get_statistics()
         return stats
@@ -150,21 +249,14 @@ async def get_vector_stats():
         return {"error": f"통계 조회 중 오류: {str(e)}"}
 
 @app.get("/vector/search")
-async def search_similar(query: str, limit: int = 5, search_type: str = "content"):
-    """유사한 콘텐츠 검색"""
-    processor = get_embedding_processor()
-    if not processor:
-        return {"error": "임베딩 처리기를 초기화할 수 없습니다."}
-    
+async def search_similar(query: str, limit: int = 5):
+    """유사한 콘텐츠 검색 (full_vector 기준)"""
     try:
-        if search_type == "title":
-            results = processor.search_similar_title(query, limit)
-        else:
-            results = processor.search_similar_content(query, limit)
+        # 동시 요청과 묶어 한 번에 임베딩/검색
+        results = await get_search_batcher().search(query, limit)
         
         return {
             "query": query,
-            "search_type": search_type,
             "limit": limit,
             "results": results
         }
@@ -174,7 +266,7 @@ async def search_similar(query: str, limit: int = 5, search_type: str = "content
 
 # ===== 추천 엔드포인트 =====
 @app.post("/recommend")
-async def recommend(payload: Dict):
+def recommend(payload: Dict):
     """
     사용자의 프로필 텍스트(학과, 성별, 나이, 관심분야 등)를 받아
     20개의 관련 공지/게시글을 추천합니다.
@@ -261,11 +353,8 @@ async def recommend(payload: Dict):
 
 # Nginx 프록시 규칙(/api/)에 맞춘 별칭 경로
 @app.post("/api/recommend")
-async def recommend_alias(payload: Dict):
-    return await recommend(payload)
-
-
-# (단일화) GET /qa 제거 → POST /qa 만 유지
+def recommend_alias(payload: Dict):
+    return recommend(payload)
 
 
 # ===== RAG QA REST 엔드포인트 (POST: 한글 안전) =====
@@ -280,22 +369,25 @@ async def rag_qa_post(payload: Dict) -> Dict:
         print(f"[POST /qa] sid={session_id} messages={len(messages) if isinstance(messages, list) else 0}")
     except Exception:
         pass
-    return run_rag_qa(query=query, limit=limit, messages=messages, session_id=session_id)
+    return await qa_batcher.submit(query=query, limit=limit, messages=messages, session_id=session_id)
 
 # ===== 간단한 채팅 엔드포인트 =====
+def extract_query(payload: Dict) -> str:
+    """input, question, query 키 순으로 질문을 찾고, 없으면 messages의 마지막 user 메시지를 사용"""
+    payload = payload or {}
+    query = payload.get("input") or payload.get("question") or payload.get("query", "")
+    if not query:
+        # 뒤에서부터 훑어 첫 user 메시지에서 중단 (긴 이력도 중간 리스트 없이 처리)
+        for m in reversed(payload.get("messages") or []):
+            if isinstance(m, dict) and m.get("role") == "user" and m.get("content"):
+                return m["content"]
+    return query
+
 @app.post("/chat_api")
 async def chat_simple(payload: Dict) -> Dict:
     """간단한 채팅 엔드포인트 - 다양한 입력 형태 지원"""
     # input, question, query 키 모두 지원
-    query = (payload or {}).get("input") or (payload or {}).get("question") or (payload or {}).get("query", "")
-    
-    # messages 배열도 지원 (마지막 user 메시지 추출)
-    if not query and "messages" in (payload or {}):
-        messages = payload.get("messages", [])
-        user_msgs = [m for m in messages if isinstance(m, dict) and m.get("role") == "user" and m.get("content")]
-        if user_msgs:
-            query = user_msgs[-1]["content"]
-    
+    query = extract_query(payload)
     if not query:
         return {"error": "질문을 입력해주세요."}
     
@@ -305,7 +397,7 @@ async def chat_simple(payload: Dict) -> Dict:
         print(f"[POST /chat_api] sid={session_id} messages={len(messages) if isinstance(messages, list) else 0}")
     except Exception:
         pass
-    result = run_rag_qa(query=query, messages=messages, session_id=session_id)
+    result = await run_rag_qa(query=query, messages=messages, session_id=session_id)
     return {
         "message": result.get("answer", "답변을 생성할 수 없습니다."),
         "query": query,
@@ -322,8 +414,8 @@ async def rag_qa_stream(payload: Dict):
     messages = (payload or {}).get("messages")
     session_id = (payload or {}).get("session_id")
 
-    def event_generator():
-        for chunk in stream_rag_qa(query=query, limit=limit, messages=messages, session_id=session_id):
+    async def event_generator():
+        async for chunk in stream_rag_qa(query=query, limit=limit, messages=messages, session_id=session_id):
             yield chunk
 
     return StreamingResponse(
@@ -339,13 +431,7 @@ async def rag_qa_stream(payload: Dict):
 
 @app.post("/chat_api/stream")
 async def chat_simple_stream(payload: Dict):
-    query = (payload or {}).get("input") or (payload or {}).get("question") or (payload or {}).get("query", "")
-    if not query and "messages" in (payload or {}):
-        msgs = payload.get("messages", [])
-        user_msgs = [m for m in msgs if isinstance(m, dict) and m.get("role") == "user" and m.get("content")]
-        if user_msgs:
-            query = user_msgs[-1]["content"]
-
+    query = extract_query(payload)
     if not query:
         # SSE 규격상 에러는 일반 JSON으로 즉시 반환하지 않고, 간단한 이벤트로 전달
         def error_gen():
@@ -355,8 +441,8 @@ async def chat_simple_stream(payload: Dict):
     messages = (payload or {}).get("messages")
     session_id = (payload or {}).get("session_id")
 
-    def event_generator():
-        for chunk in stream_rag_qa(query=query, messages=messages, session_id=session_id):
+    async def event_generator():
+        async for chunk in stream_rag_qa(query=query, messages=messages, session_id=session_id):
             yield chunk
 
     return StreamingResponse(
@@ -372,5 +458,14 @@ async def chat_simple_stream(payload: Dict):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8888)
+    # 워커마다 세션 히스토리/캐시가 따로이므로 기본은 1, RSS 스케줄러는 잠금을 얻은 워커 하나만 실행
+    # loop/http="auto"는 uvloop/httptools가 설치되어 있으면 사용
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8888,
+        workers=int(os.getenv("WORKERS", "1")),
+        loop="auto",
+        http="auto",
+    )
     
@@ -0,0 +1,117 @@
+"""
+OpenAI 호출 제한 모듈
+동시 호출 수(세마포어)와 분당 토큰/요청 수(토큰 버킷)를 제한하여 429 오류 대신 대기열에서 기다리게 하고,
+일시적인 오류는 지수 백오프로 재시도합니다.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 응답 토큰 예상치 (요청 토큰 추정에 더해짐)
+COMPLETION_TOKEN_ESTIMATE = 500
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError)
+
+
+class TokenBucket:
+    """분당 토큰(tpm)과 분당 요청(rpm) 한도를 지키는 토큰 버킷"""
+
+    def __init__(self, tpm: int, rpm: int):
+        self.tpm = tpm
+        self.rpm = rpm
+        self._tokens = float(tpm)
+        self._requests = float(rpm)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+
+    async def acquire(self, tokens: int = 1) -> None:
+        """토큰과 요청 한도가 확보될 때까지 대기 (대기 순서대로 처리)"""
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens and self._requests >= 1:
+                    self._tokens -= tokens
+                    self._requests -= 1
+                    return
+                wait_seconds = max(
+                    (tokens - self._tokens) * 60 / self.tpm,
+                    (1 - self._requests) * 60 / self.rpm,
+                )
+                await asyncio.sleep(wait_seconds)
+
+
+_llm_sem = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENT", "20")))
+_bucket = TokenBucket(
+    tpm=int(os.getenv("OPENAI_TPM", "200000")),
+    rpm=int(os.getenv("OPENAI_RPM", "500")),
+)
+
+
+def estimate_tokens(*texts: str) -> int:
+    """요청 토큰 수를 보수적으로 추정 (한국어 기준 대략 1글자 ≒ 1토큰)"""
+    return sum(len(t) for t in texts if t) + COMPLETION_TOKEN_ESTIMATE
+
+
+def _retry_delay(attempt: int, max_attempts: int, error: Exception) -> int:
+    """재시도 전 대기 시간(초), 마지막 시도였으면 오류를 다시 발생"""
+    if attempt == max_attempts:
+        raise error
+    delay = 2 ** (attempt - 1)
+    logger.warning("OpenAI 호출 실패(%d/%d), %d초 후 재시도: %s", attempt, max_attempts, delay, error)
+    return delay
+
+
+async def call_llm(factory: Callable[[], Awaitable[T]], estimated_tokens: int, max_attempts: int = 3) -> T:
+    """동시성/처리량 제한 하에 OpenAI 호출을 실행하고, 429/연결 오류는 지수 백오프로 재시도"""
+    for attempt in range(1, max_attempts + 1):
+        # 토큰 버킷 대기는 동시성 슬롯 밖에서 (대기 중인 호출이 슬롯을 차지하지 않도록)
+        await _bucket.acquire(estimated_tokens)
+        async with _llm_sem:
+            try:
+                return await factory()
+            except RETRYABLE_ERRORS as e:
+                delay = _retry_delay(attempt, max_attempts, e)
+        await asyncio.sleep(delay)
+
+
+@asynccontextmanager
+async def stream_llm(factory: Callable[[], Awaitable[T]], estimated_tokens: int, max_attempts: int = 3) -> AsyncIterator[T]:
+    """call_llm의 스트리밍 버전: 스트림을 다 읽거나 블록을 벗어날 때까지 동시성 슬롯을 유지하고, 나갈 때 스트림을 닫음"""
+    for attempt in range(1, max_attempts + 1):
+        await _bucket.acquire(estimated_tokens)
+        await _llm_sem.acquire()
+        try:
+            stream = await factory()
+            break
+        except RETRYABLE_ERRORS as e:
+            _llm_sem.release()
+            delay = _retry_delay(attempt, max_attempts, e)
+        except BaseException:
+            _llm_sem.release()
+            raise
+        await asyncio.sleep(delay)
+    try:
+        yield stream
+    finally:
+        try:
+            # 끝까지 읽지 않은 응답도 닫아 커넥션 풀 슬롯을 돌려줌
+            await stream.close()
+        finally:
+            _llm_sem.release()
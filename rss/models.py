@@ -2,7 +2,7 @@ from dataclasses import dataclass, field
 from typing import Optional, List
 
 
-@dataclass
+@dataclass(slots=True)
 class RSSItem:
     """RSS 아이템을 나타내는 데이터 클래스"""
     title: str
@@ -20,5 +20,6 @@ class RSSItem:
     content: Optional[str] = None  # HTML 제거된 깔끔한 전체 내용
     anchor_hrefs: List[str] = field(default_factory=list)  # 본문 내 a 태그 href 목록
     identifier: str = "scatch.ssu.ac.kr"
+    fetched_at_epoch: int = 0  # fetched_at의 유닉스 시간(초), 최근 아이템 정렬용
 
 
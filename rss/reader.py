@@ -1,10 +1,11 @@
+import asyncio
 import logging
 import os
-from dataclasses import asdict
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import feedparser
+import httpx
 
 from .models import RSSItem
 from .sources import KNOWN_SOURCES
@@ -21,6 +22,9 @@ from .utils import (
 
 logger = logging.getLogger(__name__)
 
+# 피드 하나당 HTTP 타임아웃(초)
+RSS_FETCH_TIMEOUT = float(os.getenv("RSS_FETCH_TIMEOUT", "30"))
+
 
 class RSSReader:
     """RSS 피드를 읽고 처리하는 메인 클래스"""
@@ -30,8 +34,8 @@ class RSSReader:
         self.identifier = identifier
         self.storage = storage or RSSStorage(storage_file=identifier_to_filename(identifier))
 
-    def _parse_rss_item(self, entry: Any) -> RSSItem:
-        """feedparser 엔트리를 RSSItem으로 변환"""
+    def _parse_rss_item(self, entry: Any, fetched_at: str, fetched_at_epoch: int) -> RSSItem:
+        """feedparser 엔트리를 RSSItem으로 변환 (수집 시각은 피드 단위로 한 번 계산해 전달)"""
         title = getattr(entry, "title", "제목 없음")
         link = getattr(entry, "link", "")
         description_raw = getattr(entry, "description", "")
@@ -84,19 +88,11 @@ class RSSReader:
         # 상대/스킴 없는 링크를 도메인 기준으로 정규화하고, 중복 제거(입력 순서 보존)
         normalized = normalize_hrefs(href_candidates, self.identifier)
         normalized = rewrite_download_urls(normalized, self.identifier)
-        seen: set = set()
-        anchor_hrefs: List[str] = []
-        for h in normalized:
-            if h and h not in seen:
-                seen.add(h)
-                anchor_hrefs.append(h)
+        anchor_hrefs: List[str] = list(dict.fromkeys(h for h in normalized if h))
 
         # 콘텐츠 해시 생성 (원본 description 기준으로 중복 체크)
         content_hash = create_content_hash(title, link, description_raw)
 
-        # 현재 시간
-        fetched_at = datetime.now(timezone.utc).isoformat()
-
         return RSSItem(
             title=title,
             link=link,
@@ -112,6 +108,7 @@ class RSSReader:
             content=content,
             anchor_hrefs=anchor_hrefs,
             identifier=self.identifier,
+            fetched_at_epoch=fetched_at_epoch,
         )
 
     def fetch_feed(self) -> Dict[str, Any]:
@@ -119,43 +116,30 @@ class RSSReader:
         logger.info("RSS 피드를 가져오는 중: %s", self.rss_url)
 
         try:
-            feed = feedparser.parse(self.rss_url)
-
-            if getattr(feed, "bozo", False):
-                logger.warning("RSS 피드 파싱 경고: %s", getattr(feed, "bozo_exception", None))
-
-            new_items: List[RSSItem] = []
-            existing_items = 0
-
-            for entry in feed.entries:
-                rss_item = self._parse_rss_item(entry)
-
-                if self.storage.add_item(rss_item):
-                    new_items.append(rss_item)
-                    logger.info("새 아이템 추가: %s", rss_item.title)
-                else:
-                    existing_items += 1
-
-            self.storage.save_items()
-
-            result: Dict[str, Any] = {
-                "status": "success",
-                "feed_title": getattr(feed.feed, "title", "제목 없음"),
-                "feed_description": getattr(feed.feed, "description", ""),
-                "total_entries": len(feed.entries),
-                "new_items": len(new_items),
-                "existing_items": existing_items,
+            # feedparser에 URL을 넘기면 타임아웃 없이 내려받으므로 httpx로 받은 본문을 파싱
+            response = httpx.get(self.rss_url, timeout=RSS_FETCH_TIMEOUT, follow_redirects=True)
+            response.raise_for_status()
+            feed = feedparser.parse(response.content, response_headers=self._response_headers(response))
+            return self._process_feed(feed)
+        except Exception as exc:  # noqa: BLE001
+            logger.error("RSS 피드 가져오기 실패: %s", exc)
+            return {
+                "status": "error",
+                "error": str(exc),
                 "fetch_time": datetime.now(timezone.utc).isoformat(),
-                "new_items_data": [asdict(item) for item in new_items],
             }
 
-            logger.info(
-                "RSS 피드 처리 완료: 새 아이템 %d개, 기존 아이템 %d개",
-                len(new_items),
-                existing_items,
-            )
-            return result
+    async def fetch_feed_async(self, client: httpx.AsyncClient) -> Dict[str, Any]:
+        """공유 httpx 클라이언트로 피드를 내려받고, 파싱/저장은 스레드에서 처리 (이벤트 루프 비블로킹)"""
+        logger.info("RSS 피드를 가져오는 중: %s", self.rss_url)
 
+        try:
+            response = await client.get(self.rss_url, timeout=RSS_FETCH_TIMEOUT, follow_redirects=True)
+            response.raise_for_status()
+            feed = await asyncio.to_thread(
+                feedparser.parse, response.content, response_headers=self._response_headers(response)
+            )
+            return await asyncio.to_thread(self._process_feed, feed)
         except Exception as exc:  # noqa: BLE001
             logger.error("RSS 피드 가져오기 실패: %s", exc)
             return {
@@ -164,13 +148,66 @@ class RSSReader:
                 "fetch_time": datetime.now(timezone.utc).isoformat(),
             }
 
+    @staticmethod
+    def _response_headers(response: httpx.Response) -> Dict[str, str]:
+        """URL로 직접 파싱할 때와 같은 기준 URL/인코딩으로 해석되도록 feedparser에 넘길 응답 헤더 (콘텐츠 해시 유지)"""
+        return {
+            "content-location": str(response.url),
+            "content-type": response.headers.get("content-type", ""),
+        }
+
+    def _process_feed(self, feed: Any) -> Dict[str, Any]:
+        """파싱된 피드의 엔트리 중 새 아이템만 저장하고 결과 요약 반환"""
+        if getattr(feed, "bozo", False):
+            logger.warning("RSS 피드 파싱 경고: %s", getattr(feed, "bozo_exception", None))
+
+        new_items: List[RSSItem] = []
+        existing_items = 0
+        # 같은 수집의 아이템은 모두 같은 수집 시각 사용
+        now = datetime.now(timezone.utc)
+        fetched_at = now.isoformat()
+        fetched_at_epoch = int(now.timestamp())
+
+        for entry in feed.entries:
+            rss_item = self._parse_rss_item(entry, fetched_at, fetched_at_epoch)
+
+            if self.storage.add_item(rss_item):
+                new_items.append(rss_item)
+                logger.info("새 아이템 추가: %s", rss_item.title)
+            else:
+                existing_items += 1
+
+        self.storage.save_items()
+
+        result: Dict[str, Any] = {
+            "status": "success",
+            "feed_title": getattr(feed.feed, "title", "제목 없음"),
+            "feed_description": getattr(feed.feed, "description", ""),
+            "total_entries": len(feed.entries),
+            "new_items": len(new_items),
+            "existing_items": existing_items,
+            "fetch_time": fetched_at,
+            "new_items_data": [self.storage.item_dict(item) for item in new_items],
+        }
+
+        logger.info(
+            "RSS 피드 처리 완료: 새 아이템 %d개, 기존 아이템 %d개",
+            len(new_items),
+            existing_items,
+        )
+        return result
+
     def get_all_items(self) -> List[Dict[str, Any]]:
         """모든 아이템을 딕셔너리 형태로 반환"""
-        return [asdict(item) for item in self.storage.get_all_items()]
+        return [self.storage.item_dict(item) for item in self.storage.get_all_items()]
 
     def get_recent_items(self, count: int = 10) -> List[Dict[str, Any]]:
         """최근 아이템들을 딕셔너리 형태로 반환"""
-        return [asdict(item) for item in self.storage.get_recent_items(count)]
+        return [self.storage.item_dict(item) for item in self.storage.get_recent_items(count)]
+
+    def get_version(self) -> Tuple[int, int]:
+        """저장된 아이템 목록의 버전 (아이템 수, 가장 최근 수집 시각)"""
+        return self.storage.get_version()
 
 
 # RSS 리더 인스턴스 생성 (싱글톤 패턴)
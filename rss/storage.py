@@ -1,22 +1,117 @@
-import json
+import glob
 import logging
 import os
-from dataclasses import asdict
-from typing import Dict, List
+import threading
+from bisect import insort
+from contextlib import contextmanager
+from dataclasses import asdict, fields
+from operator import attrgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows 등: 프로세스 간 잠금 없이 스레드 잠금만 사용
+    fcntl = None
 
 from .models import RSSItem
-from .utils import normalize_hrefs, rewrite_download_urls, identifier_to_filename
+from .utils import normalize_hrefs, rewrite_download_urls, identifier_to_filename, iso_to_epoch
 
 
 logger = logging.getLogger(__name__)
 
+# 추가 로그가 이 줄 수를 넘으면 스냅샷으로 합침
+LOG_COMPACT_EVERY = int(os.getenv("RSS_LOG_COMPACT_EVERY", "1000"))
+# 추가 로그 메모리 버퍼 크기 (넘으면 바로, 아니면 save_items 시점에 한 번에 디스크로 flush)
+LOG_BUFFER_SIZE = 256 * 1024
+
+# 같은 파일을 다루는 RSSStorage 인스턴스 간 로그 추가/압축 직렬화
+_file_locks: Dict[str, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+@contextmanager
+def _process_lock(lock_path: str, shared: bool = False) -> Iterator[None]:
+    """같은 파일을 다루는 워커 프로세스(WORKERS>1) 간 로그 추가/압축 직렬화 (fcntl.flock)"""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "ab") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# RSSItem 필드 이름 (저장 파일의 알 수 없는 키 필터링용)
+_ITEM_FIELDS = frozenset(f.name for f in fields(RSSItem))
+
+
+def item_from_dict(item_data: Dict) -> RSSItem:
+    """저장된 dict를 RSSItem으로 변환 (dataclass 정의에 없는 키 무시)"""
+    try:
+        return RSSItem(**item_data)
+    except TypeError:
+        # 불필요한 키 제거 후 재시도
+        return RSSItem(**{k: v for k, v in item_data.items() if k in _ITEM_FIELDS})
+
+
+_fetched_at_epoch = attrgetter("fetched_at_epoch")
+
+
+def _newest_first(item: RSSItem) -> int:
+    """최근 아이템 목록(fetched_at_epoch 내림차순) 정렬 키"""
+    return -item.fetched_at_epoch
+
+
+def read_log(log_path: str) -> Dict[str, Dict]:
+    """추가 전용 로그(JSON Lines)를 읽어 {content_hash: item_dict} 반환 (같은 키는 나중 줄 우선)"""
+    entries: Dict[str, Dict] = {}
+    if not os.path.exists(log_path):
+        return entries
+    with open(log_path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                item_data = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # 비정상 종료로 잘린 마지막 줄 등은 건너뜀
+                logger.warning("손상된 로그 줄을 건너뜁니다: %s", log_path)
+                continue
+            if isinstance(item_data, dict) and item_data.get("content_hash"):
+                entries[item_data["content_hash"]] = item_data
+    return entries
+
 
 class RSSStorage:
     """RSS 아이템들을 저장하고 중복을 관리하는 클래스"""
 
     def __init__(self, storage_file: str = "data/scatch_ssu_ac_kr.json"):
         self.storage_file = storage_file
+        # 새 아이템은 스냅샷(storage_file)을 다시 쓰지 않고 로그에 한 줄씩 추가
+        self._log_path = storage_file + ".log"
+        # 프로세스 간 잠금 파일 (압축 중 다른 프로세스의 로그 추가가 비워지는 로그에 섞이지 않도록)
+        self._lock_path = storage_file + ".lock"
+        # 아직 로그 파일에 쓰지 않은 줄 (스레드 잠금만으로 쌓고, 파일 쓰기는 _flush_log에서 프로세스 간 잠금과 함께)
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._log_count = 0
+        self._lock = _lock_for(storage_file)
         self.items: Dict[str, RSSItem] = {}
+        # fetched_at 내림차순 정렬 결과 캐시 (add_item은 제자리에 삽입, 다시 로드/압축하면 무효화)
+        self._recent_items: Optional[List[RSSItem]] = None
+        # 가장 최근 fetched_at_epoch (ETag용, 최근 목록을 정렬하지 않고 유지)
+        self._latest_epoch = 0
+        # content_hash -> asdict(item) 캐시 (아이템은 추가 후 바뀌지 않으므로 한 번만 변환)
+        self._dicts: Dict[str, Dict] = {}
         self.ensure_data_directory()
         self.load_items()
 
@@ -25,73 +120,136 @@ class RSSStorage:
         os.makedirs(os.path.dirname(self.storage_file), exist_ok=True)
 
     def load_items(self) -> None:
-        """저장된 아이템들을 파일에서 로드"""
-        if os.path.exists(self.storage_file):
+        """저장된 아이템들을 스냅샷 파일에서 로드한 뒤 추가 로그를 재생"""
+        if os.path.exists(self.storage_file) or os.path.exists(self._log_path):
             try:
-                with open(self.storage_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    # data는 {content_hash: item_dict}
-                    items: Dict[str, RSSItem] = {}
-                    for key, item_data in data.items():
-                        # dataclass 정의에 없는 키 무시
-                        try:
-                            items[key] = RSSItem(**item_data)
-                        except TypeError:
-                            # 불필요한 키 제거 후 재시도
-                            from dataclasses import fields as dc_fields
-                            allowed = {f.name for f in dc_fields(RSSItem)}
-                            filtered = {k: v for k, v in item_data.items() if k in allowed}
-                            items[key] = RSSItem(**filtered)
+                # 다른 프로세스의 압축(스냅샷 교체 후 로그 비우기) 도중 읽지 않도록
+                with _process_lock(self._lock_path, shared=True):
+                    data = self._read_snapshot()
+                    log_entries = read_log(self._log_path)
+                self._log_count = len(log_entries)
+                data.update(log_entries)
+                # data는 {content_hash: item_dict}, 변환과 후처리를 한 번의 순회로 수행
+                items: Dict[str, RSSItem] = {}
+                for key, item_data in data.items():
+                    it = items[key] = item_from_dict(item_data)
+                    # 이전 형식 마이그레이션: fetched_at_epoch 채우기
+                    if not it.fetched_at_epoch:
+                        it.fetched_at_epoch = iso_to_epoch(it.fetched_at)
                     # 후처리: anchor_hrefs 정규화 및 다운로드 링크 재작성
-                    for k, it in items.items():
-                        try:
-                            # dataclass 인스턴스 보장
-                            if isinstance(it.anchor_hrefs, list):
-                                norm = normalize_hrefs(it.anchor_hrefs, getattr(it, "identifier", "scatch.ssu.ac.kr"))
-                                rew = rewrite_download_urls(norm, getattr(it, "identifier", "scatch.ssu.ac.kr"))
-                                it.anchor_hrefs = []
-                                seen = set()
-                                for href in rew:
-                                    if href and href not in seen:
-                                        seen.add(href)
-                                        it.anchor_hrefs.append(href)
-                        except Exception:
-                            pass
-                    self.items = items
+                    try:
+                        if isinstance(it.anchor_hrefs, list):
+                            norm = normalize_hrefs(it.anchor_hrefs, getattr(it, "identifier", "scatch.ssu.ac.kr"))
+                            rew = rewrite_download_urls(norm, getattr(it, "identifier", "scatch.ssu.ac.kr"))
+                            it.anchor_hrefs = list(dict.fromkeys(h for h in rew if h))
+                    except Exception:
+                        pass
+                self.items = items
+                self._recent_items = None
+                self._latest_epoch = max(map(_fetched_at_epoch, items.values()), default=0)
+                self._dicts = {}
                 logger.info("기존 RSS 아이템 %d개를 로드했습니다.", len(self.items))
             except Exception as exc:  # noqa: BLE001
                 logger.error("RSS 아이템 로드 중 오류 발생: %s", exc)
                 self.items = {}
 
+    def _read_snapshot(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.storage_file):
+            return {}
+        with open(self.storage_file, "rb") as f:
+            return orjson.loads(f.read())
+
     def save_items(self) -> None:
-        """현재 아이템들을 파일에 저장"""
+        """추가 로그를 디스크에 반영하고, 로그가 LOG_COMPACT_EVERY 줄을 넘으면 스냅샷으로 합침"""
         try:
-            with open(self.storage_file, "w", encoding="utf-8") as f:
-                data = {key: asdict(item) for key, item in self.items.items()}
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with self._lock:
+                self._flush_log()
+            if self._log_count >= LOG_COMPACT_EVERY:
+                self.compact()
+        except Exception as exc:  # noqa: BLE001
+            logger.error("RSS 아이템 저장 중 오류 발생: %s", exc)
+
+    def compact(self) -> None:
+        """스냅샷 파일을 원자적으로 다시 쓰고(os.replace) 추가 로그를 비움"""
+        try:
+            with self._lock, _process_lock(self._lock_path):
+                # 버퍼에 남은 줄의 아이템은 self.items에 있어 스냅샷에 포함되므로 버림
+                self._pending.clear()
+                self._pending_bytes = 0
+                # 이 인스턴스가 로드된 뒤 다른 인스턴스가 기록한 스냅샷/로그 항목도 포함
+                on_disk = self._read_snapshot()
+                on_disk.update(read_log(self._log_path))
+                for key, item_data in on_disk.items():
+                    if key not in self.items:
+                        self.items[key] = item_from_dict(item_data)
+                        self._recent_items = None
+                        self._latest_epoch = max(self._latest_epoch, self.items[key].fetched_at_epoch)
+                data = {key: self.item_dict(item) for key, item in self.items.items()}
+                tmp_path = self.storage_file + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+                os.replace(tmp_path, self.storage_file)
+                # 합친 로그 비우기
+                if os.path.exists(self._log_path):
+                    os.truncate(self._log_path, 0)
+                self._log_count = 0
             logger.info("RSS 아이템 %d개를 저장했습니다.", len(self.items))
         except Exception as exc:  # noqa: BLE001
             logger.error("RSS 아이템 저장 중 오류 발생: %s", exc)
 
+    def _flush_log(self) -> None:
+        """버퍼에 모인 줄을 로그에 한 번에 추가 (self._lock을 잡은 상태에서 호출)"""
+        if not self._pending:
+            return
+        with _process_lock(self._lock_path), open(self._log_path, "ab") as f:
+            f.write(b"".join(self._pending))
+        self._pending.clear()
+        self._pending_bytes = 0
+
     def add_item(self, item: RSSItem) -> bool:
-        """새 아이템을 추가. 이미 존재하면 False 반환"""
+        """새 아이템을 추가하고 로그 버퍼에 한 줄 기록 (save_items에서 flush). 이미 존재하면 False 반환"""
         if item.content_hash in self.items:
             return False
 
         self.items[item.content_hash] = item
+        self._latest_epoch = max(self._latest_epoch, item.fetched_at_epoch)
+        if self._recent_items is not None:
+            # 전체를 다시 정렬하지 않고 정렬 위치에 삽입 (같은 시각이면 기존 아이템 뒤)
+            insort(self._recent_items, item, key=_newest_first)
+        line = orjson.dumps(self.item_dict(item), option=orjson.OPT_APPEND_NEWLINE)
+        with self._lock:
+            self._pending.append(line)
+            self._pending_bytes += len(line)
+            self._log_count += 1
+            if self._pending_bytes >= LOG_BUFFER_SIZE:
+                self._flush_log()
         return True
 
+    def item_dict(self, item: RSSItem) -> Dict:
+        """아이템의 dict 표현 (캐시된 객체를 공유하므로 수정하지 말 것)"""
+        data = self._dicts.get(item.content_hash)
+        if data is None:
+            data = self._dicts[item.content_hash] = asdict(item)
+        return data
+
     def get_all_items(self) -> List[RSSItem]:
         """모든 아이템을 반환"""
         return list(self.items.values())
 
     def get_recent_items(self, count: int = 10) -> List[RSSItem]:
-        """최근 아이템들을 반환"""
-        sorted_items = sorted(
-            self.items.values(),
-            key=lambda item: item.fetched_at,
-            reverse=True,
-        )
-        return sorted_items[:count]
+        """최근 아이템들을 반환 (정렬 결과를 캐시하고 새 아이템은 정렬 위치에 삽입)"""
+        if self._recent_items is None:
+            self._recent_items = sorted(self.items.values(), key=_newest_first)
+        return self._recent_items[:count]
+
+    def get_version(self) -> Tuple[int, int]:
+        """(아이템 수, 가장 최근 fetched_at_epoch) - 목록 변경 여부 판단용 (ETag)"""
+        return len(self.items), self._latest_epoch
 
 
+def compact_all(data_dir: str = "data") -> None:
+    """data 디렉토리의 모든 추가 로그를 스냅샷으로 합침 (앱 종료 시 호출)"""
+    for log_path in glob.glob(os.path.join(data_dir, "**", "*.json.log"), recursive=True):
+        if os.path.getsize(log_path) == 0:
+            continue
+        RSSStorage(storage_file=log_path[: -len(".log")]).compact()
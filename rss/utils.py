@@ -2,58 +2,141 @@ import hashlib
 import html
 import logging
 import re
-from typing import Optional, List
+from functools import lru_cache
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Optional, List, Tuple
 from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup
 
+try:  # C 기반 lxml 파서가 설치되어 있으면 사용 (순수 Python html.parser보다 빠름)
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
 
 logger = logging.getLogger(__name__)
 
+# clean_html_text에서 매 호출 재사용하는 정규식
+_CLEAN_RE = re.compile(r"[^\w\s가-힣.,!?()[\]{}:;\"'-]")
+_TAG_RE = re.compile(r"<[^>]+>")
+# ASCII 문자열은 정규식 대신 str.translate로 허용되지 않는 문자 제거 (_CLEAN_RE와 같은 결과)
+_ASCII_DELETE_TABLE = dict.fromkeys(i for i in range(128) if _CLEAN_RE.match(chr(i)))
+
+# 같은 HTML(description과 content:encoded가 같은 본문, 매 수집마다 다시 오는 기존 엔트리)의 정리 결과 재사용
+HTML_CACHE_SIZE = 2048
+HTML_CACHE_MAX_INPUT = 64 * 1024  # 이보다 긴 입력은 메모리 보호를 위해 캐시하지 않음
+
 
 def create_content_hash(title: str, link: str, description_raw: str) -> str:
-    """콘텐츠 해시를 생성하여 중복 확인용으로 사용"""
-    content = f"{title}{link}{description_raw}"
-    return hashlib.md5(content.encode("utf-8")).hexdigest()
+    """콘텐츠 해시를 생성하여 중복 확인용으로 사용 (보안 용도가 아니며, 저장된 키/Milvus id와 호환되도록 MD5 유지)"""
+    # 세 필드를 이어 붙인 문자열의 해시와 같은 값 (큰 중간 문자열을 만들지 않고 순서대로 갱신)
+    digest = hashlib.md5(usedforsecurity=False)
+    digest.update(title.encode("utf-8"))
+    digest.update(link.encode("utf-8"))
+    digest.update(description_raw.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def iso_to_epoch(timestamp: Optional[str]) -> int:
+    """ISO 8601 문자열을 유닉스 시간(초)으로 변환 (해석 불가 시 0)"""
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp())
+    except (TypeError, ValueError):
+        return 0
 
 
 def clean_html_text(html_text: Optional[str]) -> str:
     """HTML 태그와 특수 이스케이프 문자를 제거하여 깔끔한 텍스트 반환"""
     if not html_text:
         return ""
+    if "<" not in html_text and "&" not in html_text:
+        # 태그/엔티티가 없는 평문은 파서를 거치지 않고 공백/문자 정리만
+        return _normalize_text(html_text)
+    if len(html_text) > HTML_CACHE_MAX_INPUT:
+        return _clean_html_text(html_text)
+    return _clean_html_text_cached(html_text)
+
+
+def _normalize_text(text: str) -> str:
+    """연속 공백을 하나로 줄이고 허용되지 않는 문자 제거"""
+    text = " ".join(text.split())
+    if text.isascii():
+        return text.translate(_ASCII_DELETE_TABLE)
+    return _CLEAN_RE.sub("", text)
 
+
+def _clean_html_text(html_text: str) -> str:
     try:
-        soup = BeautifulSoup(html_text, "html.parser")
-        text = soup.get_text()
-        text = html.unescape(text)
-        text = re.sub(r"\s+", " ", text)
-        text = text.strip()
-        text = re.sub(r"[^\w\s가-힣.,!?()[\]{}:;\"'-]", "", text)
-        return text
+        return _normalize_text(html.unescape(_html_get_text(html_text)))
     except Exception as exc:  # noqa: BLE001
         logger.warning("HTML 텍스트 정리 중 오류 발생: %s", exc)
-        text = re.sub(r"<[^>]+>", "", html_text)
+        text = _TAG_RE.sub("", html_text)
         text = html.unescape(text)
-        text = re.sub(r"\s+", " ", text).strip()
+        text = " ".join(text.split())
         return text
 
 
+_clean_html_text_cached = lru_cache(maxsize=HTML_CACHE_SIZE)(_clean_html_text)
+
+
+def html_to_text(html_text: Optional[str]) -> str:
+    """HTML 태그를 제거하고 엔티티를 해제한 텍스트 반환 (공백/문자 정리 없음, VectorStore._clean_text와 공유)"""
+    if not html_text:
+        return ""
+    if "<" not in html_text and "&" not in html_text:
+        return html_text
+    if len(html_text) > HTML_CACHE_MAX_INPUT:
+        return _html_get_text(html_text)
+    return _html_get_text_cached(html_text)
+
+
+def _html_get_text(html_text: str) -> str:
+    return BeautifulSoup(html_text, HTML_PARSER).get_text()
+
+
+_html_get_text_cached = lru_cache(maxsize=HTML_CACHE_SIZE)(_html_get_text)
+
+
+class _AnchorHrefParser(HTMLParser):
+    """<a> 태그의 href 값만 모으는 파서 (DOM 트리를 만들지 않음)"""
+
+    def __init__(self):
+        super().__init__()
+        self.hrefs: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.hrefs.append(href.strip())
+
+
 def extract_anchor_hrefs(html_text: Optional[str]) -> List[str]:
     """HTML에서 <a> 태그의 href 값을 모두 추출하여 리스트로 반환"""
-    if not html_text:
+    if not html_text or ("<a" not in html_text and "<A" not in html_text):
         return []
+    if len(html_text) > HTML_CACHE_MAX_INPUT:
+        return list(_extract_anchor_hrefs(html_text))
+    # 캐시 값은 튜플로 공유하고 호출자에게는 새 리스트 반환
+    return list(_extract_anchor_hrefs_cached(html_text))
+
 
+def _extract_anchor_hrefs(html_text: str) -> Tuple[str, ...]:
     try:
-        soup = BeautifulSoup(html_text, "html.parser")
-        hrefs: List[str] = []
-        for a in soup.find_all("a"):
-            href = a.get("href")
-            if href:
-                hrefs.append(href.strip())
-        return hrefs
+        parser = _AnchorHrefParser()
+        parser.feed(html_text)
+        parser.close()
+        return tuple(parser.hrefs)
     except Exception as exc:  # noqa: BLE001
         logger.warning("a 태그 href 추출 중 오류 발생: %s", exc)
-        return []
+        return ()
+
+
+_extract_anchor_hrefs_cached = lru_cache(maxsize=HTML_CACHE_SIZE)(_extract_anchor_hrefs)
 
 
 def normalize_hrefs(hrefs: List[str], identifier: str) -> List[str]:
@@ -64,7 +147,7 @@ def normalize_hrefs(hrefs: List[str], identifier: str) -> List[str]:
         if not href:
             continue
         href = href.strip()
-        if href.startswith("http://") or href.startswith("https://"):
+        if href.startswith(("http://", "https://")):
             normalized.append(href)
         elif href.startswith("/"):
             normalized.append(base + href)
@@ -73,10 +156,27 @@ def normalize_hrefs(hrefs: List[str], identifier: str) -> List[str]:
     return normalized
 
 
+def _path_and_query(href: str) -> Tuple[str, str]:
+    """href의 경로와 쿼리 반환 (urlparse(href)의 path/query와 같은 결과, 흔한 형태는 문자열 탐색만으로 처리)"""
+    path, _, query = href.partition("#")[0].partition("?")
+    if not (";" in path or "\t" in href or "\r" in href or "\n" in href
+            or (href and (href[0] <= " " or href[-1] <= " "))):
+        if path.startswith(("http://", "https://")):
+            slash = path.find("/", path.index("://") + 3)
+            return (path[slash:] if slash >= 0 else ""), query
+        if ":" not in path and not path.startswith("//"):
+            return path, query
+    # 파라미터(;), 제어 문자, 다른 스킴 등 드문 형태는 urlparse로 처리
+    parsed = urlparse(href)
+    return parsed.path, parsed.query
+
+
 def rewrite_download_urls(hrefs: List[str], identifier: str) -> List[str]:
     """다운로드 링크는 도메인을 제거하고 경로+쿼리만 붙여 https://{identifier}{path}?{query} 로 재작성"""
     rewritten: List[str] = []
     base = f"https://{identifier}"
+    wrapped_prefixes = (base + "/http://", base + "/https://")
+    base_len = len(base) + 1
     for raw in hrefs:
         if not raw:
             continue
@@ -86,13 +186,11 @@ def rewrite_download_urls(hrefs: List[str], identifier: str) -> List[str]:
             continue
 
         # base/https://example.com/... 형태로 잘못된 값 정리
-        if href.startswith(base + "/http://") or href.startswith(base + "/https://"):
-            href = href[len(base) + 1 :]
+        if href.startswith(wrapped_prefixes):
+            href = href[base_len:]
 
-        parsed = urlparse(href)
         # 절대/상대 모두 처리: 경로와 쿼리만 사용
-        path = parsed.path or ""
-        query = parsed.query or ""
+        path, query = _path_and_query(href)
         new_href = base + path + ("?" + query if query else "")
         rewritten.append(new_href)
     return rewritten
@@ -1,18 +1,32 @@
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import Optional, List
+import queue
 import threading
 import time
+import httpx
 from rss import get_rss_reader
 from rss.reader import create_rss_reader_for
 from rss.sources import KNOWN_SOURCES
 from rss.utils import identifier_to_filename
-from embedding_processor import EmbeddingProcessor
+from rss.storage import compact_all
+from embedding_processor import EmbeddingProcessor, get_default_processor
 import os
 
+try:
+    import fcntl
+except ImportError:  # Windows 등: 파일 잠금 없이 항상 실행
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# 여러 워커 프로세스 중 하나만 스케줄러를 실행하도록 잡는 잠금 파일
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "/tmp/ssu_rag_scheduler.lock")
+# 임베딩 작업자가 첫 요청 후 이 시간(초) 동안 들어온 요청을 모아 한 번에 처리
+EMBED_BATCH_WINDOW_SECONDS = 2.0
+
 class RSSScheduler:
     """RSS 피드를 주기적으로 가져오는 스케줄러"""
     
@@ -21,6 +35,8 @@ class RSSScheduler:
         self.interval_seconds = interval_hours * 3600  # 시간을 초로 변환
         self.is_running = False
         self.thread: Optional[threading.Thread] = None
+        # stop() 시 대기 중인 스케줄러 루프를 즉시 깨우는 이벤트
+        self._stop_event = threading.Event()
         self.rss_reader = get_rss_reader()
         self.last_fetch_time: Optional[datetime] = None
         self.fetch_count = 0
@@ -28,6 +44,9 @@ class RSSScheduler:
         self.embedding_processor: Optional[EmbeddingProcessor] = None
         self.last_embedding_time: Optional[datetime] = None
         self.last_embedding_result: Optional[dict] = None
+        # 수집이 끝난 저장 파일 경로를 받아 임베딩하는 작업자 (None은 종료 신호)
+        self._embed_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._embed_thread: Optional[threading.Thread] = None
         
     def start(self):
         """스케줄러 시작"""
@@ -36,8 +55,11 @@ class RSSScheduler:
             return
         
         self.is_running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.thread.start()
+        self._embed_thread = threading.Thread(target=self._run_embed_worker, daemon=True)
+        self._embed_thread.start()
         logger.info(f"RSS 스케줄러가 시작되었습니다. (간격: {self.interval_hours}시간)")
         
         # 시작할 때 한 번 비동기로 실행 (앱 스타트업을 블로킹하지 않도록 별도 스레드)
@@ -50,56 +72,60 @@ class RSSScheduler:
             return
             
         self.is_running = False
+        self._stop_event.set()
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=5)
+        if self._embed_thread and self._embed_thread.is_alive():
+            self._embed_queue.put(None)
+            self._embed_thread.join(timeout=5)
+        self._embed_thread = None
         logger.info("RSS 스케줄러가 중지되었습니다.")
     
     def _run_scheduler(self):
         """스케줄러 메인 루프"""
-        while self.is_running:
+        while not self._stop_event.is_set():
             try:
-                # 다음 실행까지 대기
-                for _ in range(self.interval_seconds):
-                    if not self.is_running:
-                        break
-                    time.sleep(1)  # 1초씩 체크하여 즉시 중지 가능하도록
-                
-                if self.is_running:
-                    self._fetch_all()
-                    
+                # 다음 실행까지 대기 (stop()이 이벤트를 설정하면 즉시 깨어나 종료)
+                if self._stop_event.wait(self.interval_seconds):
+                    break
+                self._fetch_all()
+
             except Exception as e:
                 logger.error(f"스케줄러 실행 중 오류 발생: {e}")
                 # 오류가 발생해도 계속 실행
-                time.sleep(60)  # 1분 대기 후 재시도
+                self._stop_event.wait(60)  # 1분 대기 후 재시도
     
     def _fetch_rss(self):
         """기본 RSS 피드를 가져오기 (단일) - 사용 안 함"""
         pass
 
-    def _fetch_all(self):
-        """외부 파일의 identifier 목록을 순회하며 모두 수집"""
-        sources = [{"identifier": k, "rss_url": v} for k, v in KNOWN_SOURCES.items()]
-
-        for src in sources:
-            identifier = src.get("identifier")
-            if not identifier:
-                continue
-            try:
-                logger.info("정기 RSS(%s) 피드 가져오기 시작", identifier)
-                reader = create_rss_reader_for(identifier)
-                result = reader.fetch_feed()
-                if result.get("status") == "success":
-                    logger.info("[%s] 성공: 새 %d", identifier, result.get("new_items", 0))
-                else:
-                    logger.error("[%s] 실패: %s", identifier, result.get("error"))
-            except Exception as e:
-                logger.error("[%s] 수집 중 예외: %s", identifier, e)
-
-        # 수집 후 임베딩 처리 (data 디렉토리 전체 기준, 신규만 처리)
+    def _fetch_source(self, identifier: str) -> dict:
+        """소스 하나를 수집하여 identifier를 포함한 결과 반환 (예외는 오류 결과로 변환)"""
         try:
-            self._run_embedding()
+            reader = create_rss_reader_for(identifier)
+            result = reader.fetch_feed()
+            self._after_fetch(identifier, result)
+            return {"identifier": identifier, **result}
         except Exception as e:
-            logger.error("임베딩 처리 트리거 중 예외: %s", e)
+            return {"identifier": identifier, "status": "error", "error": str(e)}
+
+    def _fetch_sources(self, identifiers: List[str]) -> List[dict]:
+        """소스별 fetch_feed를 스레드풀에서 동시에 실행 (저장 파일은 identifier별로 분리되어 있음)"""
+        if not identifiers:
+            return []
+        with ThreadPoolExecutor(max_workers=min(32, len(identifiers)), thread_name_prefix="rss-fetch") as executor:
+            return list(executor.map(self._fetch_source, identifiers))
+
+    def _fetch_all(self):
+        """KNOWN_SOURCES의 identifier 목록을 모두 동시에 수집"""
+        identifiers = [identifier for identifier in KNOWN_SOURCES if identifier]
+        logger.info("정기 RSS 피드 가져오기 시작: %d개 소스", len(identifiers))
+        for result in self._fetch_sources(identifiers):
+            if result.get("status") == "success":
+                logger.info("[%s] 성공: 새 %d", result["identifier"], result.get("new_items", 0))
+            else:
+                logger.error("[%s] 실패: %s", result["identifier"], result.get("error"))
+        self._embed_if_no_worker()
     
     def get_status(self) -> dict:
         """스케줄러 상태 정보 반환"""
@@ -118,57 +144,112 @@ class RSSScheduler:
         return self.fetch_all()
 
     def fetch_all(self) -> dict:
-        """공개 API: 모든 소스를 순회하여 결과 요약 반환"""
-        results = []
-        totals = {"new_items": 0, "existing_items": 0, "total_entries": 0}
-        for item in [{"identifier": k, "rss_url": v} for k, v in KNOWN_SOURCES.items()]:
-            identifier = item["identifier"]
+        """공개 API: 모든 소스를 동시에 수집하여 결과 요약 반환"""
+        results = self._fetch_sources(list(KNOWN_SOURCES))
+        self._embed_if_no_worker()
+        return {"status": "success", "totals": self._sum_totals(results), "results": results}
+
+    async def fetch_now_async(self, client: Optional[httpx.AsyncClient] = None) -> dict:
+        """즉시 모든 RSS 피드 가져오기 (이벤트 루프용 비동기 버전)"""
+        logger.info("수동 RSS 피드 일괄 가져오기 요청")
+        return await self.fetch_all_async(client)
+
+    async def fetch_all_async(self, client: Optional[httpx.AsyncClient] = None) -> dict:
+        """모든 소스를 하나의 httpx 클라이언트로 동시에 수집하여 결과 요약 반환 (client가 없으면 임시 생성)"""
+        if client is None:
+            async with httpx.AsyncClient() as temp_client:
+                return await self.fetch_all_async(temp_client)
+
+        async def fetch(client: httpx.AsyncClient, identifier: str) -> dict:
             try:
                 reader = create_rss_reader_for(identifier)
-                result = reader.fetch_feed()
-                results.append({"identifier": identifier, **result})
-                if result.get("status") == "success":
-                    totals["new_items"] += int(result.get("new_items", 0))
-                    totals["existing_items"] += int(result.get("existing_items", 0))
-                    totals["total_entries"] += int(result.get("total_entries", 0))
+                result = await reader.fetch_feed_async(client)
+                self._after_fetch(identifier, result)
+                return {"identifier": identifier, **result}
             except Exception as e:
-                results.append({
-                    "identifier": identifier,
-                    "status": "error",
-                    "error": str(e),
-                })
-        # 수집 후 임베딩 처리 (data 디렉토리 전체 기준, 신규만 처리)
-        try:
-            self._run_embedding()
-        except Exception as e:
-            logger.error("임베딩 처리 트리거 중 예외: %s", e)
-        return {"status": "success", "totals": totals, "results": results}
+                return {"identifier": identifier, "status": "error", "error": str(e)}
+
+        results = await asyncio.gather(*(fetch(client, identifier) for identifier in KNOWN_SOURCES))
+        await asyncio.to_thread(self._embed_if_no_worker)
+        return {"status": "success", "totals": self._sum_totals(results), "results": list(results)}
+
+    @staticmethod
+    def _sum_totals(results: List[dict]) -> dict:
+        totals = {"new_items": 0, "existing_items": 0, "total_entries": 0}
+        for result in results:
+            if result.get("status") == "success":
+                totals["new_items"] += int(result.get("new_items", 0))
+                totals["existing_items"] += int(result.get("existing_items", 0))
+                totals["total_entries"] += int(result.get("total_entries", 0))
+        return totals
 
     def fetch_for(self, identifier: str) -> dict:
         """특정 identifier 피드를 즉시 가져오기"""
         logger.info("수동 RSS 피드 가져오기 요청 - identifier=%s", identifier)
         reader = create_rss_reader_for(identifier)
         result = reader.fetch_feed()
+        self._after_fetch(identifier, result)
         # 해당 identifier 파일만 대상으로 임베딩 처리
+        self._embed_if_no_worker(identifier_to_filename(identifier))
+        return result
+
+    # 내부: 수집과 임베딩 분리 (수집이 끝난 파일부터 작업자 스레드가 임베딩, 나머지 수집과 겹쳐 실행)
+    def _embed_worker_running(self) -> bool:
+        return self._embed_thread is not None and self._embed_thread.is_alive()
+
+    def _after_fetch(self, identifier: str, result: dict) -> None:
+        """수집에 성공한 소스의 저장 파일을 임베딩 작업자에게 전달"""
+        if result.get("status") == "success" and self._embed_worker_running():
+            self._embed_queue.put(identifier_to_filename(identifier))
+
+    def _embed_if_no_worker(self, json_file_path: Optional[str] = None) -> None:
+        """작업자가 없는 프로세스(스케줄러 리더가 아닌 워커 등)에서는 수집 직후 바로 임베딩 (경로가 없으면 data 전체)"""
+        if self._embed_worker_running():
+            return
         try:
-            self._run_embedding(identifier_to_filename(identifier))
+            self._run_embedding(json_file_path)
         except Exception as e:
-            logger.error("임베딩 처리 트리거 중 예외(identifier=%s): %s", identifier, e)
-        return result
+            logger.error("임베딩 처리 트리거 중 예외(%s): %s", json_file_path or "data", e)
+
+    def _run_embed_worker(self):
+        """임베딩 작업자 루프: 첫 요청 후 EMBED_BATCH_WINDOW_SECONDS 동안 들어온 요청을 모아 한 번 처리"""
+        while True:
+            path = self._embed_queue.get()
+            if path is None:
+                return
+            paths = {path}
+            stopping = False
+            deadline = time.monotonic() + EMBED_BATCH_WINDOW_SECONDS
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    path = self._embed_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if path is None:
+                    stopping = True
+                    break
+                paths.add(path)
+            # 수집이 끝난 파일만 하나씩 처리 (같은 창에 여러 번 들어온 파일은 한 번만)
+            for path in sorted(paths):
+                logger.info("임베딩 처리 시작: %s", path)
+                try:
+                    self._run_embedding(path)
+                except Exception as e:
+                    logger.error("임베딩 처리 중 예외(%s): %s", path, e)
+            if stopping:
+                return
 
     # 내부: 임베딩 프로세서 준비 및 실행
-    def _ensure_embedder(self, json_file_path: Optional[str] = None) -> EmbeddingProcessor:
-        # data 디렉토리 전체 처리용 임베더는 재사용
-        if json_file_path is None or json_file_path == "data":
-            if self.embedding_processor is None:
-                self.embedding_processor = EmbeddingProcessor(json_file_path or "data")
-            return self.embedding_processor
-        # 특정 파일 처리 시 임시 인스턴스 사용
-        return EmbeddingProcessor(json_file_path)
+    def _ensure_embedder(self) -> EmbeddingProcessor:
+        # data 전체든 특정 파일이든 API/RAG 서비스와 같은 인스턴스를 재사용 (Milvus 연결을 파일마다 새로 맺지 않도록)
+        if self.embedding_processor is None:
+            self.embedding_processor = get_default_processor()
+        return self.embedding_processor
 
     def _run_embedding(self, json_file_path: Optional[str] = None) -> dict:
-        processor = self._ensure_embedder(json_file_path)
-        result = processor.process_all_items()
+        """json_file_path 파일의 신규 아이템만 임베딩 (없으면 data 디렉토리 전체)"""
+        processor = self._ensure_embedder()
+        result = processor.process_all_items(json_file_path)
         self.last_embedding_time = datetime.now(timezone.utc)
         self.last_embedding_result = result
         logger.info("임베딩 처리 완료: %s", result)
@@ -184,12 +265,44 @@ def get_scheduler() -> RSSScheduler:
         _scheduler_instance = RSSScheduler(interval_hours=1)
     return _scheduler_instance
 
+_leader_lock_file = None
+
+def _acquire_leader_lock() -> bool:
+    """잠금 파일을 선점한 프로세스만 True (프로세스가 종료되면 잠금은 자동 해제)"""
+    global _leader_lock_file
+    if fcntl is None or _leader_lock_file is not None:
+        return True
+    lock_file = open(SCHEDULER_LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _leader_lock_file = lock_file
+    return True
+
+def _release_leader_lock():
+    global _leader_lock_file
+    if _leader_lock_file is not None:
+        fcntl.flock(_leader_lock_file, fcntl.LOCK_UN)
+        _leader_lock_file.close()
+        _leader_lock_file = None
+
 def start_scheduler():
-    """스케줄러 시작"""
+    """스케줄러 시작 (여러 워커 중 잠금을 얻은 프로세스에서만)"""
+    if not _acquire_leader_lock():
+        logger.info("다른 워커가 RSS 스케줄러를 실행 중입니다. (pid=%d)", os.getpid())
+        return
     scheduler = get_scheduler()
     scheduler.start()
 
 def stop_scheduler():
-    """스케줄러 중지"""
+    """스케줄러 중지 후 RSS 추가 로그를 스냅샷으로 합침 (스케줄러를 실행한 워커에서만)"""
     scheduler = get_scheduler()
+    if not scheduler.is_running:
+        return
     scheduler.stop()
+    compact_all()
+    _release_leader_lock()
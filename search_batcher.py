@@ -0,0 +1,158 @@
+"""
+검색 요청 배처
+동시에 들어온 질의 임베딩/벡터 검색을 짧은 시간 창(max_wait_ms, 최대 max_batch건) 단위로 모아
+OpenAI 임베딩 API 한 번, Milvus search 호출 한 번으로 처리하고 결과를 각 요청에 돌려줍니다.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from embedding_processor import get_default_processor
+
+logger = logging.getLogger(__name__)
+
+# 검색 결과 개수 상한 (한 요청의 큰 limit이 함께 묶인 다른 요청의 검색까지 실패시키지 않도록)
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+
+
+class MicroBatcher:
+    """
+    submit()으로 들어온 항목을 모아 handler(items) -> results 를 스레드에서 한 번 실행하는 배처.
+    대기열은 max_queue로 제한되어 가득 차면 submit()이 대기한다(백프레셔).
+    start() 전에는 배치 없이 항목 하나씩 바로 처리한다.
+    배치 처리 방식을 바꾸려면 _dispatch(batch)를 재정의한다 (각 future에 결과를 설정할 책임도 함께 진다).
+    """
+
+    def __init__(self, handler: Optional[Callable[[List[Any]], List[Any]]],
+                 max_batch: int = 32, max_wait_ms: int = 50, max_queue: int = 1024):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        # 대기열은 start()에서 실행 중인 이벤트 루프에 맞춰 새로 만듦 (lifespan 재시작 대비)
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._tasks = set()
+        # 모으는 중이라 아직 _dispatch에 넘기지 않은 항목
+        self._collecting: List[Tuple[Any, asyncio.Future]] = []
+
+    def start(self):
+        if self._worker is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            # 처리되지 못한 요청이 영원히 기다리지 않도록 실패 처리
+            pending = self._collecting
+            self._collecting = []
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            error = RuntimeError("배처가 중지되어 요청을 처리하지 못했습니다.")
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def submit(self, item: Any) -> Any:
+        if self._worker is None:
+            return (await asyncio.to_thread(self.handler, [item]))[0]
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = self._collecting = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._collecting = []
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await asyncio.to_thread(self.handler, [item for item, _ in batch])
+        except Exception as e:
+            logger.error("배치 처리 실패(%d건): %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class SearchBatcher:
+    """질의 임베딩과 벡터 검색을 각각 묶어 처리하는 검색 배처"""
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: int = 50, max_queue: int = 1024):
+        self._embedder = MicroBatcher(self._embed_batch, max_batch, max_wait_ms, max_queue)
+        self._searcher = MicroBatcher(self._search_batch, max_batch, max_wait_ms, max_queue)
+
+    def start(self):
+        self._embedder.start()
+        self._searcher.start()
+
+    async def stop(self):
+        await self._embedder.stop()
+        await self._searcher.stop()
+
+    async def embed(self, query: str) -> List[float]:
+        """질의 임베딩 (동시 요청과 묶어 한 번의 API 호출)"""
+        return await self._embedder.submit(query)
+
+    async def search_vector(self, vector: List[float], limit: int = 5) -> List[Dict]:
+        """벡터 검색 (동시 요청과 묶어 한 번의 Milvus search 호출, limit은 1~SEARCH_MAX_LIMIT로 제한)"""
+        return await self._searcher.submit((vector, max(1, min(int(limit), SEARCH_MAX_LIMIT))))
+
+    async def search(self, query: str, limit: int = 5) -> List[Dict]:
+        """질의 임베딩 후 벡터 검색"""
+        return await self.search_vector(await self.embed(query), limit)
+
+    @staticmethod
+    def _embed_batch(queries: List[str]) -> List[List[float]]:
+        return get_default_processor().embed_queries(queries)
+
+    @staticmethod
+    def _search_batch(requests: List[Tuple[List[float], int]]) -> List[List[Dict]]:
+        # 가장 큰 limit으로 한 번에 검색한 뒤 요청별 limit만큼 잘라서 반환
+        limit = max(limit for _, limit in requests)
+        results = get_default_processor().search_by_vectors([vector for vector, _ in requests], limit)
+        return [hits[:limit] for hits, (_, limit) in zip(results, requests)]
+
+
+_search_batcher: Optional[SearchBatcher] = None
+
+
+def get_search_batcher() -> SearchBatcher:
+    """검색 배처 싱글톤 인스턴스 반환"""
+    global _search_batcher
+    if _search_batcher is None:
+        _search_batcher = SearchBatcher(
+            max_batch=int(os.getenv("SEARCH_BATCH_MAX", "32")),
+            max_wait_ms=int(os.getenv("SEARCH_BATCH_WAIT_MS", "50")),
+            max_queue=int(os.getenv("SEARCH_BATCH_QUEUE", "1024")),
+        )
+    return _search_batcher
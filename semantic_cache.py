@@ -0,0 +1,139 @@
+"""
+의미 기반 응답 캐시
+정규화한 질문이 같거나 질문 임베딩의 코사인 유사도가 임계값 이상인 이전 응답을 재사용하여
+검색과 LLM 답변 생성을 생략합니다. (대화 이력이 답변에 영향을 주지 않는 세션 없는 요청 전용)
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.95"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# 항목 수가 이 값 이상이면 최근접 탐색을 워커 스레드에서 실행 (이벤트 루프 차단 방지)
+VECTOR_SCAN_THREAD_MIN = int(os.getenv("VECTOR_SCAN_THREAD_MIN", "256"))
+
+
+def make_prompt_hash(*parts: Any) -> str:
+    """답변에 영향을 주는 설정(모델, 시스템 프롬프트, 검색 개수 등)의 해시"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class VectorIndex:
+    """키 -> (단위 벡터, 그룹, 값)을 담는 TTL + LRU 캐시
+    단위 벡터는 삽입/제거 시점에 행렬 한 개에 반영해 두므로 최근접 탐색은 행렬곱 한 번으로 끝납니다.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._slots: "OrderedDict[Hashable, int]" = OrderedDict()  # 키 -> 행 번호 (최근 사용 순서가 뒤쪽)
+        self._free: List[int] = list(range(maxsize - 1, -1, -1))
+        self._used = 0  # 한 번이라도 쓰인 행 수 (탐색 범위)
+        self._matrix: Optional[np.ndarray] = None  # 첫 삽입 시 (maxsize, 차원)으로 할당
+        self._expires = np.full(maxsize, -np.inf)  # 빈 행은 -inf
+        self._group_ids = np.full(maxsize, -1, dtype=np.int64)
+        self._groups: Dict[Hashable, int] = {}
+        self._values: List[Any] = [None] * maxsize
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _release(self, key: Hashable) -> None:
+        row = self._slots.pop(key)
+        self._expires[row] = -np.inf
+        self._values[row] = None
+        self._free.append(row)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """키가 정확히 같은 항목의 값 반환"""
+        with self._lock:
+            row = self._slots.get(key)
+            if row is None:
+                return None
+            if self._expires[row] < time.monotonic():
+                self._release(key)
+                return None
+            self._slots.move_to_end(key)
+            return self._values[row]
+
+    def put(self, key: Hashable, unit: np.ndarray, group: Hashable, value: Any) -> None:
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.maxsize, unit.shape[0]), dtype=np.float32)
+            elif unit.shape[0] != self._matrix.shape[1]:
+                return
+            if key in self._slots:
+                self._release(key)
+            if not self._free:
+                self._release(next(iter(self._slots)))
+            row = self._free.pop()
+            self._used = max(self._used, row + 1)
+            self._matrix[row] = unit
+            self._expires[row] = time.monotonic() + self.ttl
+            self._group_ids[row] = self._groups.setdefault(group, len(self._groups))
+            self._values[row] = value
+            self._slots[key] = row
+
+    def nearest(self, unit: np.ndarray, group: Hashable) -> Optional[Tuple[float, Any]]:
+        """같은 그룹의 만료되지 않은 항목 중 코사인 유사도가 가장 큰 항목의 (유사도, 값) 반환"""
+        with self._lock:
+            group_id = self._groups.get(group)
+            if group_id is None or self._matrix is None or unit.shape[0] != self._matrix.shape[1]:
+                return None
+            used = self._used
+            similarities = self._matrix[:used] @ unit
+            valid = (self._group_ids[:used] == group_id) & (self._expires[:used] >= time.monotonic())
+            if not valid.any():
+                return None
+            similarities[~valid] = -np.inf
+            best = int(np.argmax(similarities))
+            return float(similarities[best]), self._values[best]
+
+    async def anearest(self, unit: np.ndarray, group: Hashable) -> Optional[Tuple[float, Any]]:
+        """nearest와 같으나 항목이 많으면 워커 스레드에서 탐색"""
+        if len(self) >= VECTOR_SCAN_THREAD_MIN:
+            return await asyncio.to_thread(self.nearest, unit, group)
+        return self.nearest(unit, group)
+
+
+class SemanticCache:
+    """질문 단위 벡터로 유사 질문을 찾는 프로세스 내 응답 캐시"""
+
+    def __init__(self,
+                 threshold: float = CACHE_SIMILARITY_THRESHOLD,
+                 ttl: float = CACHE_TTL,
+                 maxsize: int = CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        # sha256(prompt_hash:정규화 질문) -> (단위 벡터, prompt_hash, 응답)
+        self._entries = VectorIndex(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(normalized_query: str, prompt_hash: str) -> str:
+        return hashlib.sha256(f"{prompt_hash}:{normalized_query}".encode("utf-8")).hexdigest()
+
+    async def lookup(self, normalized_query: str, unit: Optional[np.ndarray], prompt_hash: str) -> Optional[Dict]:
+        """같은 질문이 있으면 바로, 없으면 유사도 최댓값이 임계값 이상인 항목의 응답 반환"""
+        response = self._entries.get(self._key(normalized_query, prompt_hash))
+        if response is not None:
+            return response
+        if unit is None:
+            return None
+        # prompt_hash가 같은 항목끼리만 비교 (설정이 다른 응답 재사용 방지)
+        match = await self._entries.anearest(unit, prompt_hash)
+        if match is not None and match[0] >= self.threshold:
+            return match[1]
+        return None
+
+    def store(self, normalized_query: str, unit: Optional[np.ndarray], prompt_hash: str, response: Dict) -> None:
+        if unit is None:
+            return
+        self._entries.put(self._key(normalized_query, prompt_hash), unit, prompt_hash, response)
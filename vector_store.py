@@ -10,15 +10,23 @@ import json
 import hashlib
 from typing import List, Dict, Optional, Set
 from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility
-from openai import OpenAI
+from openai import BadRequestError, OpenAI
 from datetime import datetime
 import logging
-from bs4 import BeautifulSoup
+from rss.utils import html_to_text
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+# _clean_text 정규식
+_ENTITY_RE = re.compile(r'&[a-zA-Z0-9#]+;')
+# 임베딩 API 1회 호출당 입력 개수
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+# 임베딩 입력 1개당 최대 글자 수 (모델 한도 8191토큰, 한국어 1글자가 1토큰을 넘을 수 있어 여유를 둠)
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", "6000"))
+
 class VectorStore:
     def __init__(self, 
                  collection_name: str = "rss_items",
@@ -38,7 +46,11 @@ class VectorStore:
         self.collection_name = collection_name
         self.milvus_host = milvus_host
         self.milvus_port = milvus_port
-        self.embedding_dim = 1536  # OpenAI text-embedding-3-small 차원
+        # OpenAI text-embedding-3-small 차원 (기본 1536, dimensions 파라미터로 축소 가능)
+        # 기존 컬렉션과 차원이 다르면 컬렉션을 새로 만들어 재임베딩해야 함
+        self.embedding_dim = int(os.getenv("EMBEDDING_DIM", "1536"))
+        # 새 컬렉션 생성 시 사용할 인덱스 (IVF_SQ8: 벡터를 int8로 스칼라 양자화해 메모리 1/4)
+        self.index_type = os.getenv("MILVUS_INDEX_TYPE", "IVF_SQ8")
         self.metric_type = "COSINE"  # 유사도 계산 방식: COSINE
         
         # OpenAI 클라이언트 초기화
@@ -82,6 +94,11 @@ class VectorStore:
         if utility.has_collection(self.collection_name):
             self.collection = Collection(self.collection_name)
             logger.info(f"기존 컬렉션을 사용합니다: {self.collection_name}")
+            for field in self.collection.schema.fields:
+                if field.name == "full_vector" and int(field.params.get("dim", self.embedding_dim)) != self.embedding_dim:
+                    logger.warning(
+                        f"컬렉션 벡터 차원({field.params.get('dim')})이 EMBEDDING_DIM({self.embedding_dim})과 다릅니다."
+                    )
             return
         
         # 컬렉션 스키마 정의
@@ -115,7 +132,7 @@ class VectorStore:
     def _create_indexes(self):
         """벡터 필드에 인덱스 생성"""
         index_params = {
-            "index_type": "IVF_FLAT",
+            "index_type": self.index_type,
             "metric_type": self.metric_type,
             "params": {"nlist": 100}
         }
@@ -147,14 +164,12 @@ class VectorStore:
         if not text:
             return ""
         
-        # BeautifulSoup으로 HTML 태그 제거
-        soup = BeautifulSoup(text, 'html.parser')
-        cleaned = soup.get_text()
+        # HTML 태그 제거 (RSS 수집과 같은 파서/캐시 사용)
+        cleaned = html_to_text(text)
         
         # 특수 문자 및 이스케이프 문자 제거
-        cleaned = re.sub(r'&[a-zA-Z0-9#]+;', ' ', cleaned)  # HTML 엔티티
-        cleaned = re.sub(r'\s+', ' ', cleaned)  # 연속된 공백을 하나로
-        cleaned = cleaned.strip()
+        cleaned = _ENTITY_RE.sub(' ', cleaned)  # HTML 엔티티
+        cleaned = " ".join(cleaned.split())  # 연속된 공백을 하나로
         
         return cleaned
     
@@ -170,8 +185,9 @@ class VectorStore:
             
             # OpenAI 임베딩 생성
             response = self.openai_client.embeddings.create(
-                model="text-embedding-3-small",
-                input=clean_text
+                model=EMBEDDING_MODEL,
+                input=clean_text,
+                dimensions=self.embedding_dim
             )
             
             return response.data[0].embedding
@@ -179,11 +195,89 @@ class VectorStore:
         except Exception as e:
             logger.error(f"임베딩 생성 실패: {e}")
             return [0.0] * self.embedding_dim
+
+    def _generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        여러 텍스트를 한 번의 API 호출로 임베딩 (빈 텍스트는 제로 벡터)
+        API가 거부한 입력은 None으로 표시하고, 연결/한도 오류 등은 그대로 예외로 전달합니다.
+        """
+        clean_texts = [self._clean_text(text) for text in texts]
+        vectors: List[Optional[List[float]]] = [[0.0] * self.embedding_dim for _ in clean_texts]
+        targets = [i for i, text in enumerate(clean_texts) if text]
+        if targets:
+            embedded = self._embed_texts([clean_texts[i] for i in targets])
+            for i, vector in zip(targets, embedded):
+                vectors[i] = vector
+        return vectors
+
+    def _embed_texts(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """묶음 임베딩 호출이 입력 문제로 거부되면 반씩 나눠 재시도하여 문제 입력만 None으로 남김"""
+        try:
+            response = self.openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=texts,
+                dimensions=self.embedding_dim
+            )
+        except BadRequestError as e:
+            if len(texts) == 1:
+                logger.error(f"임베딩 생성 실패(입력 거부): {e}")
+                return [None]
+            mid = len(texts) // 2
+            return self._embed_texts(texts[:mid]) + self._embed_texts(texts[mid:])
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for data in response.data:
+            vectors[data.index] = data.embedding
+        return vectors
     
     def is_item_processed(self, content_hash: str) -> bool:
         """아이템이 이미 처리되었는지 확인"""
         return content_hash in self._processed_hashes
     
+    def _build_item_text(self, item_data: Dict) -> str:
+        """임베딩 대상 텍스트 구성 (옵션 A: 주요 필드를 라벨링하여 단일 문서 임베딩)"""
+        parts: List[str] = []
+        for label, key in (("Title", "title"), ("Description", "description"), ("Content", "content"),
+                           ("Author", "author"), ("Category", "category"), ("Published", "published")):
+            value = item_data.get(key, "")
+            if value:
+                parts.append(f"{label}: {self._clean_text(value)}")
+        return "\n".join(parts)[:EMBEDDING_MAX_CHARS]
+
+    def _build_entity(self, item_data: Dict, full_vector: List[float]) -> Dict:
+        """Milvus에 삽입할 엔티티 구성"""
+        content_hash = item_data.get("content_hash", "")
+        return {
+            "id": content_hash,
+            "content_hash": content_hash,
+            "title": self._clean_text(item_data.get("title", ""))[:1000],  # 길이 제한
+            "description": self._clean_text(item_data.get("description", ""))[:4000],
+            "content": self._clean_text(item_data.get("content", ""))[:10000],  # 길이 제한
+            "author": self._clean_text(item_data.get("author", ""))[:200],
+            "category": self._clean_text(item_data.get("category", ""))[:200],
+            "published": self._clean_text(item_data.get("published", ""))[:100],
+            "link": item_data.get("link", "")[:1000],
+            "identifier": item_data.get("identifier", "")[:200],
+            "anchor_hrefs": json.dumps(item_data.get("anchor_hrefs", []), ensure_ascii=False)[:60000],
+            "created_at": datetime.now().isoformat(),
+            "raw_json": json.dumps(item_data, ensure_ascii=False)[:60000],
+            "full_vector": full_vector
+        }
+
+    def build_entities(self, items_data: List[Dict]) -> List[Dict]:
+        """아이템 묶음을 한 번의 API 호출로 임베딩하여 Milvus 엔티티로 변환 (임베딩이 거부된 아이템은 제외)"""
+        vectors = self._generate_embeddings([self._build_item_text(item) for item in items_data])
+        entities = [self._build_entity(item, vector) for item, vector in zip(items_data, vectors) if vector is not None]
+        if len(entities) < len(items_data):
+            # 제외된 아이템은 처리 완료로 표시되지 않아 다음 실행 때 재시도
+            logger.warning(f"임베딩 실패로 {len(items_data) - len(entities)}개 아이템을 제외했습니다.")
+        return entities
+
+    def insert_entities(self, entities: List[Dict]) -> int:
+        """엔티티를 Milvus에 삽입하고 처리 완료로 표시 (flush는 호출 측에서)"""
+        self.collection.insert(entities)
+        self._processed_hashes.update(entity["content_hash"] for entity in entities)
+        return len(entities)
+
     def add_item(self, item_data: Dict) -> bool:
         """새로운 RSS 아이템을 벡터 DB에 추가"""
         try:
@@ -194,51 +288,11 @@ class VectorStore:
                 logger.info(f"이미 처리된 아이템입니다: {content_hash}")
                 return False
             
-            # 텍스트 임베딩 생성 (옵션 A: 주요 필드를 라벨링하여 단일 문서 임베딩)
             title = item_data.get("title", "")
-            description = item_data.get("description", "")
-            content = item_data.get("content", "")
-            author = item_data.get("author", "")
-            category = item_data.get("category", "")
-            published = item_data.get("published", "")
-
-            parts: List[str] = []
-            if title:
-                parts.append(f"Title: {self._clean_text(title)}")
-            if description:
-                parts.append(f"Description: {self._clean_text(description)}")
-            if content:
-                parts.append(f"Content: {self._clean_text(content)}")
-            if author:
-                parts.append(f"Author: {self._clean_text(author)}")
-            if category:
-                parts.append(f"Category: {self._clean_text(category)}")
-            if published:
-                parts.append(f"Published: {self._clean_text(published)}")
-
-            combined_text = "\n".join(parts)
-
             logger.info(f"임베딩 생성 중: {title[:50]}...")
 
-            full_vector = self._generate_embedding(combined_text)
-            
-            # 데이터 준비
-            entity = {
-                "id": content_hash,
-                "content_hash": content_hash,
-                "title": self._clean_text(title)[:1000],  # 길이 제한
-                "description": self._clean_text(description)[:4000],
-                "content": self._clean_text(content)[:10000],  # 길이 제한
-                "author": self._clean_text(author)[:200],
-                "category": self._clean_text(category)[:200],
-                "published": self._clean_text(published)[:100],
-                "link": item_data.get("link", "")[:1000],
-                "identifier": item_data.get("identifier", "")[:200],
-                "anchor_hrefs": json.dumps(item_data.get("anchor_hrefs", []), ensure_ascii=False)[:60000],
-                "created_at": datetime.now().isoformat(),
-                "raw_json": json.dumps(item_data, ensure_ascii=False)[:60000],
-                "full_vector": full_vector
-            }
+            full_vector = self._generate_embedding(self._build_item_text(item_data))
+            entity = self._build_entity(item_data, full_vector)
             
             # Milvus에 삽입
             self.collection.insert([entity])
@@ -255,13 +309,26 @@ class VectorStore:
             return False
     
     def add_items_batch(self, items_data: List[Dict]) -> int:
-        """여러 RSS 아이템을 배치로 추가"""
+        """여러 RSS 아이템을 배치로 추가 (EMBEDDING_BATCH_SIZE개씩 한 번에 임베딩/삽입)"""
         added_count = 0
-        
+        pending: Dict[str, Dict] = {}
         for item_data in items_data:
-            if self.add_item(item_data):
-                added_count += 1
-        
+            content_hash = item_data.get("content_hash", "")
+            if not self.is_item_processed(content_hash):
+                pending.setdefault(content_hash, item_data)
+        pending_items = list(pending.values())
+
+        for start in range(0, len(pending_items), EMBEDDING_BATCH_SIZE):
+            batch = pending_items[start:start + EMBEDDING_BATCH_SIZE]
+            try:
+                added_count += self.insert_entities(self.build_entities(batch))
+                logger.info(f"배치 임베딩 완료: {added_count}/{len(pending_items)}")
+            except Exception as e:
+                # 실패한 배치는 처리 완료로 표시하지 않아 다음 실행 때 재시도
+                logger.error(f"배치 추가 실패: {e}")
+
+        if added_count:
+            self.collection.flush()
         logger.info(f"총 {added_count}개의 새로운 아이템이 추가되었습니다.")
         return added_count
     
@@ -270,6 +337,25 @@ class VectorStore:
                        search_field: str = "full_vector",
                        limit: int = 5) -> List[Dict]:
         """유사한 아이템 검색"""
+        # 쿼리 텍스트 임베딩 생성
+        query_vector = self._generate_embedding(query_text)
+        return self.search_by_vector(query_vector, limit)
+
+    def embed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """여러 검색 쿼리를 한 번의 API 호출로 임베딩 (묶음 호출 실패 시 쿼리별로 다시 임베딩)"""
+        try:
+            zero = [0.0] * self.embedding_dim
+            return [vector if vector is not None else zero for vector in self._generate_embeddings(query_texts)]
+        except Exception as e:
+            logger.error(f"배치 임베딩 생성 실패, 쿼리별로 재시도: {e}")
+            return [self._generate_embedding(query_text) for query_text in query_texts]
+
+    def search_by_vector(self, query_vector: List[float], limit: int = 5) -> List[Dict]:
+        """미리 계산된 쿼리 벡터로 유사한 아이템 검색"""
+        return self.search_by_vectors([query_vector], limit)[0]
+
+    def search_by_vectors(self, query_vectors: List[List[float]], limit: int = 5) -> List[List[Dict]]:
+        """여러 쿼리 벡터를 한 번의 Milvus search 호출로 검색 (입력 순서대로 결과 목록 반환)"""
         try:
             # 컬렉션이 메모리에 없는 경우 로드 시도
             try:
@@ -277,9 +363,6 @@ class VectorStore:
             except Exception:
                 pass
 
-            # 쿼리 텍스트 임베딩 생성
-            query_vector = self._generate_embedding(query_text)
-            
             # 검색 파라미터
             search_params = {
                 "metric_type": self.metric_type,
@@ -290,35 +373,37 @@ class VectorStore:
             effective_field = "full_vector"
 
             results = self.collection.search(
-                data=[query_vector],
+                data=query_vectors,
                 anns_field=effective_field,
                 param=search_params,
                 limit=limit,
-                output_fields=["title", "description", "content", "author", "category", "published", "link", "identifier", "anchor_hrefs", "raw_json"]
+                output_fields=["title", "description", "content", "author", "category", "published", "link", "identifier", "anchor_hrefs"]
             )
             
             # 결과 변환
-            similar_items = []
-            for hit in results[0]:
-                similar_items.append({
-                    "id": hit.id,
-                    "distance": hit.distance,
-                    "title": hit.entity.get("title"),
-                    "description": hit.entity.get("description"),
-                    "content": hit.entity.get("content"),
-                    "author": hit.entity.get("author"),
-                    "category": hit.entity.get("category"),
-                    "published": hit.entity.get("published"),
-                    "link": hit.entity.get("link"),
-                    "identifier": hit.entity.get("identifier"),
-                    "anchor_hrefs": hit.entity.get("anchor_hrefs")
-                })
-            
-            return similar_items
+            return [
+                [
+                    {
+                        "id": hit.id,
+                        "distance": hit.distance,
+                        "title": hit.entity.get("title"),
+                        "description": hit.entity.get("description"),
+                        "content": hit.entity.get("content"),
+                        "author": hit.entity.get("author"),
+                        "category": hit.entity.get("category"),
+                        "published": hit.entity.get("published"),
+                        "link": hit.entity.get("link"),
+                        "identifier": hit.entity.get("identifier"),
+                        "anchor_hrefs": hit.entity.get("anchor_hrefs")
+                    }
+                    for hit in hits
+                ]
+                for hits in results
+            ]
             
         except Exception as e:
             logger.error(f"유사 검색 실패: {e}")
-            return []
+            return [[] for _ in query_vectors]
     
     def get_stats(self) -> Dict:
         """벡터 스토어 통계 정보"""